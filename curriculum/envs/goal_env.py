@@ -82,6 +82,7 @@ class GoalExplorationEnv(GoalEnv, ProxyEnv, Serializable):
         ProxyEnv.__init__(self, env)
         GoalEnv.__init__(self, **kwargs)
         self.update_goal_generator(goal_generator)
+        self._observation_space_cache = None
         
         if obs2goal_transform is None:
             self._obs2goal_transform = lambda x: x   # needed for replay old policies [:2]
@@ -127,6 +128,26 @@ class GoalExplorationEnv(GoalEnv, ProxyEnv, Serializable):
         else:
             return True
 
+    def is_feasible_n(self, goals):
+        """ Batch version of is_feasible: boolean array telling which goals are feasible. """
+        obj = self.wrapped_env
+        while not hasattr(obj, 'is_feasible_n') and hasattr(obj, 'wrapped_env'):
+            obj = obj.wrapped_env
+        if hasattr(obj, 'is_feasible_n'):
+            return obj.is_feasible_n(np.array(goals))
+        return np.array([self.is_feasible(goal) for goal in goals], dtype=bool)
+
+    def in_collision_n(self, positions):
+        """ Boolean array telling which positions are in collision in the wrapped env, if it can tell. """
+        obj = self.wrapped_env
+        while not hasattr(obj, 'in_collision_n') and hasattr(obj, 'wrapped_env'):
+            obj = obj.wrapped_env
+        if hasattr(obj, 'in_collision_n'):
+            return obj.in_collision_n(np.array(positions))
+        if hasattr(obj, '_is_in_collision'):
+            return np.array([obj._is_in_collision(pos) for pos in positions], dtype=bool)
+        return np.zeros(len(positions), dtype=bool)
+
     def reset(self, reset_goal=True, **kwargs):  # allows to pass init_state if needed
         if reset_goal:
             self.update_goal()
@@ -230,12 +251,19 @@ class GoalExplorationEnv(GoalEnv, ProxyEnv, Serializable):
             )
         return np.concatenate([obs, np.array(self.current_goal)])
 
+    def _observation_space_key(self):
+        """ What the shape of the observation depends on (besides the wrapped env), used to cache its space. """
+        return self.append_goal_to_observation, self.append_transformed_obs, np.size(self.current_goal)
+
     @property
     @overrides
     def observation_space(self):
-        shp = self.get_current_obs().shape
-        ub = BIG * np.ones(shp)
-        return spaces.Box(ub * -1, ub)
+        key = self._observation_space_key()
+        if self._observation_space_cache is None or self._observation_space_cache[0] != key:
+            shp = self.get_current_obs().shape
+            ub = BIG * np.ones(shp)
+            self._observation_space_cache = (key, spaces.Box(ub * -1, ub))
+        return self._observation_space_cache[1]
 
     @overrides
     def log_diagnostics(self, paths, n_traj=1, *args, **kwargs):
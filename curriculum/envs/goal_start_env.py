@@ -73,6 +73,10 @@ class GoalStartExplorationEnv(StartEnv, GoalExplorationEnv, Serializable):
         goal_obs = GoalExplorationEnv.get_current_obs(self)
         return StartEnv.append_start_observation(self, goal_obs)
 
+    @overrides
+    def _observation_space_key(self):
+        return GoalExplorationEnv._observation_space_key(self) + (self.append_start, np.size(self.current_start))
+
     @overrides
     def transform_to_start_space(self, obs, *args, **kwargs):
         obj = self.wrapped_env
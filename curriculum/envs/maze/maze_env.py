@@ -72,6 +72,7 @@ class MazeEnv(ProxyEnv, Serializable):
         torso_x, torso_y = self._find_robot()
         self._init_torso_x = torso_x
         self._init_torso_y = torso_y
+        self._build_occupancy_grid()
 
         for i in range(len(structure)):
             for j in range(len(structure[0])):
@@ -119,6 +120,7 @@ class MazeEnv(ProxyEnv, Serializable):
 
         self._goal_range = self._find_goal_range()
         self._cached_segments = None
+        self._observation_space = None
 
         inner_env = model_cls(file_path=file_path, *args, **kwargs)  # file to the robot specifications
         ProxyEnv.__init__(self, inner_env)  # here is where the robot env will be initialized
@@ -159,9 +161,11 @@ class MazeEnv(ProxyEnv, Serializable):
     @property
     @overrides
     def observation_space(self):
-        shp = self.get_current_obs().shape
-        ub = BIG * np.ones(shp)
-        return spaces.Box(ub * -1, ub)
+        if self._observation_space is None:
+            shp = self.get_current_obs().shape
+            ub = BIG * np.ones(shp)
+            self._observation_space = spaces.Box(ub * -1, ub)
+        return self._observation_space
 
     # space of only the robot observations (they go first in the get current obs) THIS COULD GO IN PROXYENV
     @property
@@ -197,40 +201,102 @@ class MazeEnv(ProxyEnv, Serializable):
                     maxy = i * size_scaling + size_scaling * 0.5 - self._init_torso_y
                     return minx, maxx, miny, maxy
 
-    def _is_in_collision(self, pos):
-        x, y = pos
+    def _build_occupancy_grid(self):
+        """
+        Precompute the wall and empty cells of the maze, with the bounds and centers of every row and column of cells,
+        so that collision and feasibility checks only look at the cells around the position.
+        """
         structure = self.MAZE_STRUCTURE
         size_scaling = self.MAZE_SIZE_SCALING
-        for i in range(len(structure)):
-            for j in range(len(structure[0])):
-                if structure[i][j] == 1:
-                    minx = j * size_scaling - size_scaling * 0.5 - self._init_torso_x
-                    maxx = j * size_scaling + size_scaling * 0.5 - self._init_torso_x
-                    miny = i * size_scaling - size_scaling * 0.5 - self._init_torso_y
-                    maxy = i * size_scaling + size_scaling * 0.5 - self._init_torso_y
-                    if minx <= x <= maxx and miny <= y <= maxy:
+        n_rows, n_cols = len(structure), len(structure[0])
+        self._wall_grid = np.array([[structure[i][j] == 1 for j in range(n_cols)] for i in range(n_rows)])
+        self._empty_grid = np.array([[structure[i][j] == 'r' or structure[i][j] == 'g' or structure[i][j] == 0
+                                      for j in range(n_cols)] for i in range(n_rows)])
+        col_index, row_index = np.arange(n_cols), np.arange(n_rows)
+        self._cells_minx = col_index * size_scaling - size_scaling * 0.5 - self._init_torso_x
+        self._cells_maxx = col_index * size_scaling + size_scaling * 0.5 - self._init_torso_x
+        self._cells_miny = row_index * size_scaling - size_scaling * 0.5 - self._init_torso_y
+        self._cells_maxy = row_index * size_scaling + size_scaling * 0.5 - self._init_torso_y
+        self._cells_cx = col_index * size_scaling - self._init_torso_x
+        self._cells_cy = row_index * size_scaling - self._init_torso_y
+        self._empty_space = [(float(self._cells_cx[j]), float(self._cells_cy[i]))
+                             for i in range(n_rows) for j in range(n_cols) if self._empty_grid[i, j]]
+
+    def _neighbor_cells(self, x, y):
+        """ Rows and columns of the cells that can contain (x, y), including their neighbors for border cases. """
+        if not (np.isfinite(x) and np.isfinite(y)):
+            # no cell contains a NaN or infinite position
+            return range(0), range(0)
+        size_scaling = self.MAZE_SIZE_SCALING
+        i = int(math.floor((y + self._init_torso_y) / size_scaling + 0.5))
+        j = int(math.floor((x + self._init_torso_x) / size_scaling + 0.5))
+        n_rows, n_cols = self._wall_grid.shape
+        return range(max(i - 1, 0), min(i + 2, n_rows)), range(max(j - 1, 0), min(j + 2, n_cols))
+
+    def _lookup_cells_n(self, positions, grid, is_inside):
+        """
+        Vectorized check of whether each position is inside one of the cells marked in grid, where
+        is_inside(x, y, rows, cols) tells if the positions are inside the cells at the given rows and columns.
+        """
+        positions = np.array(positions, dtype=float).reshape((len(positions), -1))
+        x, y = positions[:, 0], positions[:, 1]
+        # no cell contains a NaN or infinite position
+        finite = np.isfinite(x) & np.isfinite(y)
+        size_scaling = self.MAZE_SIZE_SCALING
+        n_rows, n_cols = grid.shape
+        rows = np.floor(np.where(finite, (y + self._init_torso_y) / size_scaling + 0.5, -2)).astype(int)
+        cols = np.floor(np.where(finite, (x + self._init_torso_x) / size_scaling + 0.5, -2)).astype(int)
+        result = np.zeros(len(positions), dtype=bool)
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                valid = (0 <= rows + d_row) & (rows + d_row < n_rows) & (0 <= cols + d_col) & (cols + d_col < n_cols)
+                cell_rows = np.clip(rows + d_row, 0, n_rows - 1)
+                cell_cols = np.clip(cols + d_col, 0, n_cols - 1)
+                result |= valid & grid[cell_rows, cell_cols] & is_inside(x, y, cell_rows, cell_cols)
+        return result
+
+    def _is_in_collision(self, pos):
+        x, y = pos
+        rows, cols = self._neighbor_cells(x, y)
+        for i in rows:
+            for j in cols:
+                if self._wall_grid[i, j]:
+                    if self._cells_minx[j] <= x <= self._cells_maxx[j] and \
+                                    self._cells_miny[i] <= y <= self._cells_maxy[i]:
                         return True
         return False
 
+    def in_collision_n(self, positions):
+        """ Batch version of _is_in_collision: boolean array telling which (x, y) positions are inside a wall. """
+        minx, maxx, miny, maxy = self._cells_minx, self._cells_maxx, self._cells_miny, self._cells_maxy
+        return self._lookup_cells_n(
+            positions, self._wall_grid,
+            lambda x, y, rows, cols: (minx[cols] <= x) & (x <= maxx[cols]) & (miny[rows] <= y) & (y <= maxy[rows])
+        )
+
     def find_empty_space(self):
-        structure = self.MAZE_STRUCTURE
-        size_scaling = self.MAZE_SIZE_SCALING
-        empty_space = []
-        for i in range(len(structure)):
-            for j in range(len(structure[0])):
-                if structure[i][j] == 'r' or structure[i][j] == 'g' or structure[i][j] == 0:
-                    empty_space.append((j * size_scaling - self._init_torso_x, i * size_scaling - self._init_torso_y))
-                    #return j * size_scaling, i * size_scaling
-        return empty_space
+        return list(self._empty_space)
 
     def is_feasible(self, pos):  # the arg is the goal, not the full space!!!
-        empty_space = self.find_empty_space()
-        for space in empty_space:
-            if np.size(np.where(np.abs(np.array(np.array(pos).reshape(-1)[:2])-np.array(space)) < self.MAZE_SIZE_SCALING/2)[0]) == 2:
-                # print("Pos {} is in empty space: {}".format(pos, space))
-                return True
+        x, y = np.array(pos).reshape(-1)[:2]
+        rows, cols = self._neighbor_cells(x, y)
+        for i in rows:
+            for j in cols:
+                if self._empty_grid[i, j]:
+                    if abs(x - self._cells_cx[j]) < self.MAZE_SIZE_SCALING / 2 and \
+                                    abs(y - self._cells_cy[i]) < self.MAZE_SIZE_SCALING / 2:
+                        return True
         return False
 
+    def is_feasible_n(self, positions):
+        """ Batch version of is_feasible: boolean array telling which positions (first 2 coords) are in empty cells. """
+        cx, cy = self._cells_cx, self._cells_cy
+        half_size = self.MAZE_SIZE_SCALING / 2
+        return self._lookup_cells_n(
+            positions, self._empty_grid,
+            lambda x, y, rows, cols: (np.abs(x - cx[cols]) < half_size) & (np.abs(y - cy[rows]) < half_size)
+        )
+
     @overrides
     def reset(self, *args, **kwargs):
         return self.wrapped_env.reset(*args, **kwargs)
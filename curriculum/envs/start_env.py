@@ -39,7 +39,7 @@ from curriculum.experiments.asym_selfplay.envs.alice_env import AliceEnv
 from curriculum.state.evaluator import parallel_map, FunctionWrapper
 from curriculum.state.utils import StateCollection
 from curriculum.logging.visualization import plot_labeled_states, plot_labeled_samples
-from curriculum.state.evaluator import FunctionWrapper, parallel_map
+from curriculum.state.evaluator import FunctionWrapper, parallel_map, resident_map
 from rllab.sampler.stateful_pool import singleton_pool
 
 
@@ -247,19 +247,19 @@ def generate_starts(env, policy=None, starts=None, horizon=50, size=10000, subsa
                 # time.sleep(timestep / speedup)
             else:
                 # import pdb; pdb.set_trace()
-                brownian_state_wrapper = FunctionWrapper(
+                parallel_starts = [starts[j % n_starts] for j in range(i,i+singleton_pool.n_parallel)]
+                # print("parallel sampling from :", parallel_starts)
+                i += singleton_pool.n_parallel
+                results = resident_map(
                     brownian,
-                    env=env,
+                    parallel_starts,
+                    env,
+                    policy,
                     kill_outside=env.kill_outside,
                     kill_radius=env.kill_radius,  # this should be set before passing the env to generate_starts
                     horizon=horizon,
                     variance=variance,
-                    policy=policy,
                 )
-                parallel_starts = [starts[j % n_starts] for j in range(i,i+singleton_pool.n_parallel)]
-                # print("parallel sampling from :", parallel_starts)
-                i += singleton_pool.n_parallel
-                results = parallel_map(brownian_state_wrapper, parallel_starts)
                 new_states = np.concatenate([result[0] for result in results])
 
                 # show where these states are:
@@ -284,16 +284,19 @@ def generate_starts(env, policy=None, starts=None, horizon=50, size=10000, subsa
         return states[np.random.choice(np.shape(states)[0], size=subsample)]
 
 def parallel_check_feasibility(starts, env, max_path_length=50, n_processes=-1):
-    feasibility_wrapper = FunctionWrapper(
-        check_feasibility,
-        env =env,
-        max_path_length=max_path_length,
-    )
-    is_feasible = parallel_map(
-        feasibility_wrapper,
-        starts,
-        n_processes,
-    )
+    if n_processes == -1:
+        is_feasible = resident_map(check_feasibility, starts, env, max_path_length=max_path_length)
+    else:
+        feasibility_wrapper = FunctionWrapper(
+            check_feasibility,
+            env =env,
+            max_path_length=max_path_length,
+        )
+        is_feasible = parallel_map(
+            feasibility_wrapper,
+            starts,
+            n_processes,
+        )
     #TODO: is there better way to do this?
     result = [starts[i] for i in range(len(starts)) if is_feasible[i]] # keep starts that are feasible only
     return np.array(result)
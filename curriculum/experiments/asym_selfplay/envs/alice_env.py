@@ -37,6 +37,7 @@ class AliceEnv(ProxyEnv, Serializable):
         self.gamma = gamma
         self.stop_threshold = stop_threshold
         self.start_generation = start_generation
+        self._action_space = None
 
 
     def reset(self, **kwargs):
@@ -47,12 +48,14 @@ class AliceEnv(ProxyEnv, Serializable):
     @property
     @overrides
     def action_space(self):
-        if isinstance(self._wrapped_env.action_space, Box):
-            wrapped_low = np.append(self._wrapped_env.action_space.low,[-1])
-            wrapped_high = np.append(self._wrapped_env.action_space.high, [1])
-            return spaces.Box(wrapped_low, wrapped_high)
-        else:
-            raise NotImplementedError
+        if self._action_space is None:
+            if isinstance(self._wrapped_env.action_space, Box):
+                wrapped_low = np.append(self._wrapped_env.action_space.low,[-1])
+                wrapped_high = np.append(self._wrapped_env.action_space.high, [1])
+                self._action_space = spaces.Box(wrapped_low, wrapped_high)
+            else:
+                raise NotImplementedError
+        return self._action_space
 
     def compute_alice_reward(self, next_obs):
         alice_end_obs = next_obs
@@ -14,7 +14,7 @@ from rllab.misc import logger
 from curriculum.logging import HTMLReport
 from curriculum.logging import format_dict
 from curriculum.logging.logger import ExperimentLogger
-from curriculum.logging.visualization import plot_labeled_states
+from curriculum.logging.visualization import plot_labeled_states, AsyncPlotter
 
 os.environ['THEANO_FLAGS'] = 'floatX=float32,device=cpu'
 os.environ['CUDA_VISIBLE_DEVICES'] = ''
@@ -137,6 +137,8 @@ def run_task(v):
     report.new_row()
 
     all_goals = StateCollection(distance_threshold=v['coll_eps'])
+    # the labeled goals are plotted in the background while the GAN trains
+    plotter = AsyncPlotter()
 
     for outer_iter in range(1, v['outer_iters']):
 
@@ -207,7 +209,7 @@ def run_task(v):
         # labels = label_states(goals, env, policy, v['horizon'], n_traj=v['n_traj'], key='goal_reached')
 
         plot_labeled_states(goals, labels, report=report, itr=outer_iter, limit=v['goal_range'],
-                            center=v['goal_center'], maze_id=v['maze_id'])
+                            center=v['goal_center'], maze_id=v['maze_id'], plotter=plotter)
 
         # ###### extra for deterministic:
         # logger.log("Labeling the goals deterministic")
@@ -224,6 +226,7 @@ def run_task(v):
         )
 
         logger.dump_tabular(with_prefix=False)
+        plotter.flush()
         report.new_row()
 
         # append new goals to list of all goals (replay buffer): Not the low reward ones!!
@@ -236,3 +239,5 @@ def run_task(v):
                                                     horizon=v['horizon'])
             # downsampled_feasible_goals = feasible_goals[np.random.choice(feasible_goals.shape[0], v['add_on_policy']),:]
             all_goals.append(feasible_goals)
+
+    plotter.close()
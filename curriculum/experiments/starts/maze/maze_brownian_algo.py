@@ -21,7 +21,8 @@ from rllab.baselines.linear_feature_baseline import LinearFeatureBaseline
 from rllab.envs.normalized_env import normalize
 from rllab.policies.gaussian_mlp_policy import GaussianMLPPolicy
 
-from curriculum.state.evaluator import convert_label, label_states, evaluate_states, label_states_from_paths
+from curriculum.state.evaluator import convert_label, label_states, evaluate_states, label_states_from_paths, \
+    label_states_reusing_paths
 from curriculum.envs.base import UniformListStateGenerator, UniformStateGenerator, FixedStateGenerator
 from curriculum.state.utils import StateCollection
 
@@ -147,8 +148,9 @@ def run_task(v):
             paths = [path for paths in trpo_paths for path in paths]
         else:
             logger.log("labeling starts manually")
-            labels, paths = label_states(starts, env, policy, v['horizon'], as_goals=False, n_traj=v['n_traj'],
-                                         key='goal_reached', full_path=True)
+            labels, paths = label_states_reusing_paths(starts, trpo_paths[-1:], env, policy, v['horizon'],
+                                                       as_goals=False, n_traj=v['n_traj'], key='goal_reached',
+                                                       full_path=True)
 
         with logger.tabular_prefix("OnStarts_"):
             env.log_diagnostics(paths)
@@ -24,7 +24,7 @@ from rllab.baselines.linear_feature_baseline import LinearFeatureBaseline
 from rllab.envs.normalized_env import normalize
 from rllab.policies.gaussian_mlp_policy import GaussianMLPPolicy
 
-from curriculum.state.evaluator import convert_label, label_states, evaluate_states
+from curriculum.state.evaluator import convert_label, label_states, evaluate_states, label_states_reusing_paths
 from curriculum.envs.base import UniformListStateGenerator, UniformStateGenerator, FixedStateGenerator
 from curriculum.state.utils import StateCollection
 
@@ -142,7 +142,7 @@ def run_task(v):
                 plot=False,
             )
 
-            algo.train()
+            trpo_paths = algo.train()
 
         logger.log('Generating the Heatmap...')
         plot_policy_means(policy, env, sampling_res=2, report=report, limit=v['start_range'], center=v['start_center'])
@@ -150,7 +150,8 @@ def run_task(v):
                              itr=outer_iter, report=report, center=v['goal_center'], limit=v['goal_range'])
 
         logger.log("Labeling the starts")
-        labels = label_states(starts, env, policy, v['horizon'], as_goals=False, n_traj=v['n_traj'], key='goal_reached')
+        labels = label_states_reusing_paths(starts, trpo_paths[-1:], env, policy, v['horizon'], as_goals=False,
+                                            n_traj=v['n_traj'], key='goal_reached')
 
         plot_labeled_states(starts, labels, report=report, itr=outer_iter, limit=v['goal_range'],
                             center=v['goal_center'], maze_id=v['maze_id'])
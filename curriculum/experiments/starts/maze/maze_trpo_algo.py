@@ -94,13 +94,14 @@ def run_task(v):
 
         logger.log("Outer itr # %i" % outer_iter)
         if v['only_feasible_sampling']:
-            starts = []
+            # rejection sampling, checking a whole batch of candidates at once
+            starts = np.zeros((0, v['start_size']))
             while len(starts) < v['num_new_starts']:
-                raw_start = np.random.uniform(np.array(v['start_center']) - np.array(v['start_range']),
-                                   np.array(v['start_center']) + np.array(v['start_range']), size=(1, v['start_size']))
-                if env.is_feasible(raw_start):
-                    starts.append(raw_start)
-            starts = np.array(starts).reshape(-1, v['start_size'])
+                raw_starts = np.random.uniform(np.array(v['start_center']) - np.array(v['start_range']),
+                                               np.array(v['start_center']) + np.array(v['start_range']),
+                                               size=(v['num_new_starts'], v['start_size']))
+                starts = np.vstack([starts, raw_starts[env.is_feasible_n(raw_starts)]])
+            starts = starts[:v['num_new_starts']]
         else:
             starts = np.random.uniform(np.array(v['start_center']) - np.array(v['start_range']),
                                            np.array(v['start_center']) + np.array(v['start_range']), size=(v['num_new_starts'], v['start_size']))
@@ -2,15 +2,13 @@ import dominate
 from dominate.tags import *
 from pdb import set_trace as st
 
-# Note here it is important to use the scipy imsave as it allows us to save
-# the image into a file object
 from scipy.misc import imsave as sp_imsave
 from skimage.io import imread, imsave
 from skimage import img_as_int
 
 import os
-from io import BytesIO
-from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import datetime
 
 
@@ -29,48 +27,79 @@ def format_dict(d):
 
 
 class HTMLReport:
-    def __init__(self, path, images_per_row=2, default_image_width=400):
+    """
+    HTML report written incrementally: headers, texts and rows of images are appended to the file as they are
+    added, and only the row being filled is written again when it changes. Images are saved once as PNG files in a
+    folder next to the report, optionally encoded and written on a background thread.
+    """
+
+    def __init__(self, path, images_per_row=2, default_image_width=400, async_images=False):
         self.path = path
         title = datetime.datetime.today().strftime(
             "Report %Y-%m-%d_%H-%M-%S_{}".format(os.uname()[1])
         )
-        self.doc = dominate.document(title=title)
         self.images_per_row = images_per_row
         self.default_image_width = default_image_width
         self.t = None
         self.row_image_count = 0
+        # the open table is written at this offset, and written again there whenever it gets an image
+        self._table_offset = None
+        self.image_dir = os.path.splitext(path)[0] + '_images'
+        os.makedirs(self.image_dir, exist_ok=True)
+        self._image_count = 0
+        self._image_writer = ThreadPoolExecutor(max_workers=1) if async_images else None
+        self._image_futures = []
+        self._fd = open(path, 'wb')
+        self._write(
+            '<!DOCTYPE html>\n<html>\n<head>\n<title>{}</title>\n</head>\n<body>\n'.format(title)
+        )
 
-    def add_header(self, str):
-        with self.doc:
-            h3(str, style='word-wrap: break-word; white-space: pre-wrap;')
+    def _write(self, html):
+        self._fd.write(html.encode('utf-8'))
+
+    def _close_table(self):
+        if self.t is not None:
+            self._write_table()
         self.t = None
+        self._table_offset = None
         self.row_image_count = 0
-        
+
+    def _write_table(self):
+        self._fd.seek(self._table_offset)
+        self._fd.truncate()
+        self._write(self.t.render() + '\n')
+
+    def add_header(self, str):
+        self._close_table()
+        self._write(h3(str, style='word-wrap: break-word; white-space: pre-wrap;').render() + '\n')
+        self._fd.flush()
+
     def add_text(self, str):
-        with self.doc:
-            p(str, style='word-wrap: break-word; white-space: pre-wrap;')
-        self.t = None
-        self.row_image_count = 0
+        self._close_table()
+        self._write(p(str, style='word-wrap: break-word; white-space: pre-wrap;').render() + '\n')
+        self._fd.flush()
 
     def _add_table(self, border=1):
-        self.row_image_count = 0
+        self._close_table()
         self.t = table(border=border, style="table-layout: fixed;")
-        self.doc.add(self.t)
+        self._table_offset = self._fd.tell()
 
-    def _encode_image(self, img_arr):
-        """Save the image array as PNG and then encode with base64 for embedding"""
-        img_arr = img_as_int(img_arr)
-        sio = BytesIO()
-        sp_imsave(sio, img_arr, 'png')
-        encoded = b64encode(sio.getvalue()).decode()
-        sio.close()
-        return encoded
+    def _save_image(self, img_arr, file_name):
+        sp_imsave(file_name, img_as_int(img_arr), 'png')
 
     def add_image(self, im, txt='', width=None, font_pct=100):
         if width is None:
             width = self.default_image_width
         if self.t is None or self.row_image_count >= self.images_per_row:
             self._add_table()
+        image_name = 'image_%05d.png' % self._image_count
+        self._image_count += 1
+        image_file = os.path.join(self.image_dir, image_name)
+        if self._image_writer is not None:
+            # copied, the caller may reuse the array
+            self._image_futures.append(self._image_writer.submit(self._save_image, np.array(im), image_file))
+        else:
+            self._save_image(im, image_file)
         with self.t:
             # with tr():
             #with td(style="word-wrap: break-word;", halign="center", valign="top"):
@@ -78,7 +107,7 @@ class HTMLReport:
                 with p():
                     img(
                         style="width:%dpx" % width,
-                        src=r'data:image/png;base64,' + self._encode_image(im)
+                        src=os.path.basename(self.image_dir) + '/' + image_name
                     )
                     br()
                     p(
@@ -89,10 +118,13 @@ class HTMLReport:
                         )
                     )
         self.row_image_count += 1
+        self._write_table()
+        self._fd.flush()
 
     def new_row(self):
         self.save()
         self.t = None
+        self._table_offset = None
         self.row_image_count = 0
 
     def add_images(self, ims, txts, width=256):
@@ -100,10 +132,28 @@ class HTMLReport:
             self.add_image(im, txt, width)
 
     def save(self):
-        f = open(self.path, 'w')
-        f.write(self.doc.render())
-        f.close()
-        
-    def __del__(self):
-        self.save()
+        """
+        Everything added is already in the file; this makes sure it is on disk, and reports the errors of the
+        images written in the background.
+        """
+        if self._fd.closed:
+            return
+        self._fd.flush()
+        for future in self._image_futures:
+            if future.done():
+                future.result()
+        self._image_futures = [future for future in self._image_futures if not future.done()]
+
+    def close(self):
+        if self._fd.closed:
+            return
+        if self._image_writer is not None:
+            self._image_writer.shutdown(wait=True)
+            for future in self._image_futures:
+                future.result()
+            self._image_futures = []
+        self._write('</body>\n</html>\n')
+        self._fd.close()
 
+    def __del__(self):
+        self.close()
@@ -1,6 +1,8 @@
-import tempfile
 import math
 import gc
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 
 import numpy as np
 import scipy.misc
@@ -19,6 +21,61 @@ import matplotlib.patches as patches
 # rc('text', usetex=True)
 from mpl_toolkits.mplot3d import Axes3D
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+def rasterize_figure(fig=None, **savefig_kwargs):
+    """
+    RGBA image (uint8) of the figure, by default the current one, read directly from its Agg canvas. Options of
+    savefig that change the saved area (e.g. bbox_inches='tight') need a savefig, which is then done to an in-memory
+    PNG.
+    """
+    if fig is None:
+        fig = plt.gcf()
+    if savefig_kwargs:
+        buf = BytesIO()
+        fig.savefig(buf, format='png', **savefig_kwargs)
+        buf.seek(0)
+        img = scipy.misc.imread(buf)
+        buf.close()
+        return img
+    buf, (width, height) = fig.canvas.print_to_buffer()
+    return np.frombuffer(buf, dtype=np.uint8).reshape(height, width, 4).copy()
+
+
+class AsyncPlotter(object):
+    """
+    Renders plots on a background thread and adds the images to their report in the order they were requested.
+    Images are added by the thread calling plot or flush, so the report is only used by that thread. pyplot is not
+    thread-safe, so the plot functions must build their figure without it, like plot_labeled_samples does. At most
+    max_pending plots wait for their image: flush before starting a new row of the report.
+    """
+
+    def __init__(self, max_pending=4):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
+
+    def plot(self, report, txt, plot_fn, *args, width=None, **kwargs):
+        """
+        Call plot_fn(*args, **kwargs) in the background, then add the image it returns to the report.
+        """
+        while self._pending and (self._pending[0][3].done() or len(self._pending) >= self.max_pending):
+            self._add_first()
+        self._pending.append((report, txt, width, self._executor.submit(plot_fn, *args, **kwargs)))
+
+    def _add_first(self):
+        report, txt, width, future = self._pending.popleft()
+        report.add_image(future.result(), txt, width=width)
+
+    def flush(self):
+        while self._pending:
+            self._add_first()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
 
 
 def plot_policy_reward(policy, env, limit, horizon=200, max_reward=6000, fname=None, grid_size=60,
@@ -48,25 +105,20 @@ def plot_policy_reward(policy, env, limit, horizon=200, max_reward=6000, fname=N
     plt.colorbar()
     if fname is not None:
         plt.savefig(fname, format='png')
-        if return_rewards:
-            return scipy.misc.imread(fname), z
-        else:
-            return scipy.misc.imread(fname)
+        img = scipy.misc.imread(fname)
     else:
-        fp = tempfile.TemporaryFile()
-        plt.savefig(fp, format='png')
-        fp.seek(0)
-        img = scipy.misc.imread(fp)
-        fp.close()
-        if return_rewards:
-            return img, z
-        else:
-            return img
+        img = rasterize_figure()
+    if return_rewards:
+        return img, z
+    else:
+        return img
 
 
 def save_image(fig=None, fname=None):
     if fname is None:
-        fname = tempfile.TemporaryFile()
+        img = rasterize_figure(fig)
+        plt.close('all')
+        return img
     if fig is not None:
         fig.savefig(fname)
     else:
@@ -79,7 +131,10 @@ def save_image(fig=None, fname=None):
 
 
 def plot_labeled_states(states, labels, convert_labels=convert_label, report=None,
-                        itr=0, limit=None, center=None, maze_id=None, summary_string_base=None):
+                        itr=0, limit=None, center=None, maze_id=None, summary_string_base=None, plotter=None):
+    """
+    :param plotter: AsyncPlotter to render the image in the background instead of before returning
+    """
     goal_classes, text_labels = convert_labels(labels)
     total_goals = labels.shape[0]
     goal_class_frac = OrderedDict()  # this needs to be an ordered dict!! (for the log tabular)
@@ -88,16 +143,23 @@ def plot_labeled_states(states, labels, convert_labels=convert_label, report=Non
         logger.record_tabular('GenGoal_frac_' + text_labels[k], frac)
         goal_class_frac[text_labels[k]] = frac
 
-    img = plot_labeled_samples(
-        samples=states, sample_classes=goal_classes, text_labels=text_labels, limit=limit,
-        center=center, maze_id=maze_id,
-    )
     if summary_string_base is None:
         summary_string_base = 'Labels for {} goals:\n'.format(len(states))
     summary_string = summary_string_base
     for key, value in goal_class_frac.items():
         summary_string += key + ' frac: ' + str(value) + '\n'
-    report.add_image(img, 'itr: {}\n{}'.format(itr, summary_string), width=500)
+    plot_kwargs = dict(
+        samples=states, sample_classes=goal_classes, text_labels=text_labels, limit=limit,
+        center=center, maze_id=maze_id,
+    )
+    if plotter is not None:
+        # copied, the caller may change the states before they are plotted
+        plot_kwargs['samples'] = np.array(states)
+        plotter.plot(report, 'itr: {}\n{}'.format(itr, summary_string), plot_labeled_samples, width=500,
+                     **plot_kwargs)
+    else:
+        img = plot_labeled_samples(**plot_kwargs)
+        report.add_image(img, 'itr: {}\n{}'.format(itr, summary_string), width=500)
 
 
 def plot_labeled_samples(samples, sample_classes=None, text_labels=None, markers=None, fname=None, limit=None,
@@ -122,8 +184,10 @@ def plot_labeled_samples(samples, sample_classes=None, text_labels=None, markers
     if center is None:
         center = np.zeros(samples.shape[1])
 
+    # built without pyplot, so that it can be plotted outside of the main thread (see AsyncPlotter)
+    fig = Figure()
+    FigureCanvasAgg(fig)
     if np.size(center) >= 3:
-        fig = plt.figure()
         ax = fig.add_subplot(111, projection='3d')
         if bounds is not None:
             plot_bounds(ax, bounds, dim=3)
@@ -144,7 +208,7 @@ def plot_labeled_samples(samples, sample_classes=None, text_labels=None, markers
                 label=text_labels[i]
             )
     else:
-        fig, ax = plt.subplots()
+        ax = fig.add_subplot(111)
         if bounds is not None:
             plot_bounds(ax, bounds, 2, label='state bound')
         elif maze_id == 0:
@@ -183,28 +247,16 @@ def plot_labeled_samples(samples, sample_classes=None, text_labels=None, markers
             ax.set_ylim(center[0] - limit, center[0] + limit)
             ax.set_xlim(center[1] - limit, center[1] + limit)
     # Place the legend to the right of the plot.
-    lgd = plt.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+    lgd = ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
 
     if fname is not None:
-        plt.savefig(fname, format='png', bbox_extra_artists=(lgd,), bbox_inches='tight')
-        # plt.cla()
-        # plt.clf()
-        plt.close('all')
-        # del fig, ax, cmap, cbar, map_plot
-        gc.collect()
-        return scipy.misc.imread(fname)
+        fig.savefig(fname, format='png', bbox_extra_artists=(lgd,), bbox_inches='tight')
+        img = scipy.misc.imread(fname)
     else:
-        fp = tempfile.TemporaryFile()
-        plt.savefig(fp, format='png', bbox_extra_artists=(lgd,), bbox_inches='tight')
-        fp.seek(0)
-        img = scipy.misc.imread(fp)
-        fp.close()
-        # plt.cla()
-        # plt.clf()
-        plt.close('all')
-        # del fig, ax, cmap, cbar, map_plot
-        gc.collect()
-        return img
+        img = rasterize_figure(fig, bbox_extra_artists=(lgd,), bbox_inches='tight')
+    del fig, ax
+    gc.collect()
+    return img
 
 
 def plot_bounds(ax, bounds, dim=2, label='', color='b'):
@@ -261,11 +313,7 @@ def plot_gan_samples(gan, limit, fname=None, size=500):
         gc.collect()
         return scipy.misc.imread(fname)
     else:
-        fp = tempfile.TemporaryFile()
-        plt.savefig(fp, format='png')
-        fp.seek(0)
-        img = scipy.misc.imread(fp)
-        fp.close()
+        img = rasterize_figure()
         # plt.cla()
         # plt.clf()
         plt.close('all')
@@ -282,9 +330,4 @@ def plot_line_graph(fname=None, *args, **kwargs):
         plt.savefig(fname, format='png')
         return scipy.misc.imread(fname)
     else:
-        fp = tempfile.TemporaryFile()
-        plt.savefig(fp, format='png')
-        fp.seek(0)
-        img = scipy.misc.imread(fp)
-        fp.close()
-        return img
+        return rasterize_figure()
@@ -4,9 +4,11 @@ import tempfile
 import numpy as np
 from collections import OrderedDict
 import cloudpickle
+import scipy.spatial
 import time
 
 from rllab.sampler.utils import rollout
+from rllab.sampler.stateful_pool import singleton_pool, SharedGlobal
 from rllab.misc import logger
 
 from curriculum.envs.base import FixedStateGenerator
@@ -75,6 +77,111 @@ def parallel_map(func, iterable_object, num_processes=-1):
     process_pool.join()
     return results
 
+EVALUATOR_SCOPE = "curriculum_evaluator"
+
+# what the workers of the singleton pool were populated with: the pool and its G, the pickled env and the policy
+_cached_evaluator = None
+
+
+def _get_evaluator_G(G):
+    if not hasattr(G, "scopes"):
+        G.scopes = dict()
+    if EVALUATOR_SCOPE not in G.scopes:
+        G.scopes[EVALUATOR_SCOPE] = SharedGlobal()
+    return G.scopes[EVALUATOR_SCOPE]
+
+
+def _get_state_generators(env):
+    """ Collect the (small) state generators of the env, to be shipped with every evaluation call. """
+    generators = dict()
+    if hasattr(env, 'goal_generator'):
+        generators['update_goal_generator'] = env.goal_generator
+    if hasattr(env, 'start_generator'):
+        generators['update_start_generator'] = env.start_generator
+    return generators
+
+
+def _worker_populate_evaluator(G, env, policy):
+    G = _get_evaluator_G(G)
+    G.env = cloudpickle.loads(env)
+    G.policy = cloudpickle.loads(policy)
+
+
+def _worker_update_evaluator(G, policy_params, generators):
+    G = _get_evaluator_G(G)
+    if policy_params is not None:
+        G.policy.set_param_values(policy_params)
+    for update_method, generator in generators.items():
+        getattr(G.env, update_method)(generator)
+
+
+def _worker_evaluate_chunk(G, func, chunk, env_kwarg, policy_kwarg, kwargs):
+    G = _get_evaluator_G(G)
+    kwargs = dict(kwargs)
+    kwargs[env_kwarg] = G.env
+    if policy_kwarg is not None:
+        kwargs[policy_kwarg] = G.policy
+    return [func(**kwargs) if obj is None else func(obj, **kwargs) for obj in chunk]
+
+
+def populate_evaluator(env, policy=None):
+    """
+    Make a copy of the env and the policy resident on every worker of the singleton pool. The env is pickled at every
+    call, which is cheap next to shipping and loading it on the workers, and they are only populated again when its
+    pickle changed (e.g. the running statistics of a NormalizedEnv), when the policy is another object, or when the
+    pool was initialized again since. The state generators of the env and the parameters of the policy are not
+    covered: resident_map updates them at every call.
+    """
+    global _cached_evaluator
+    env_data = cloudpickle.dumps(env)
+    if _cached_evaluator is not None:
+        pool, G, cached_env_data, cached_policy = _cached_evaluator
+        if pool is singleton_pool.pool and G is singleton_pool.G and cached_env_data == env_data \
+                and cached_policy is policy:
+            return
+    logger.log("Populating evaluator workers...")
+    # the resident copy is used even without parallelism, so that evaluating states never modifies the given env
+    singleton_pool.run_each(
+        _worker_populate_evaluator,
+        [(env_data, cloudpickle.dumps(policy))] * singleton_pool.n_parallel
+    )
+    _cached_evaluator = (singleton_pool.pool, singleton_pool.G, env_data, policy)
+
+
+def resident_map(func, iterable_object, env, policy=None, env_kwarg='env', policy_kwarg='policy', **kwargs):
+    """Parallelized map over the workers of the singleton pool, using the env and policy resident on them.
+    Only the policy parameters, the env state generators and the elements to map on are shipped on each call.
+    Args:
+    func: top level function taking one element (or nothing if the element is None) and the env/policy as kwargs.
+    iterable_object: An iterable of elements to map the function on.
+    env: the env to evaluate on. It is populated on the workers only when it changes (see populate_evaluator).
+    policy: the policy to evaluate, or None. Its parameters are updated on the workers at every call.
+    env_kwarg, policy_kwarg: names under which func receives the resident env and policy.
+    **kwargs: any additional (small) arguments for func.
+    Returns:
+    The list resulted in calling the func on all objects in the original list.
+    """
+    objects = list(iterable_object)
+    populate_evaluator(env, policy)
+    policy_params = policy.get_param_values() if policy is not None else None
+    singleton_pool.run_each(
+        _worker_update_evaluator,
+        [(policy_params, _get_state_generators(env))] * singleton_pool.n_parallel
+    )
+    if policy is None:
+        policy_kwarg = None
+    n_chunks = min(singleton_pool.n_parallel, len(objects))
+    if n_chunks == 0:
+        return []
+    chunk_size = int(np.ceil(len(objects) / float(n_chunks)))
+    chunks = [objects[i: i + chunk_size] for i in range(0, len(objects), chunk_size)]
+    results = singleton_pool.run_map(
+        _worker_evaluate_chunk,
+        [(func, chunk, env_kwarg, policy_kwarg, kwargs) for chunk in chunks]
+    )
+    return [result for chunk_results in results for result in chunk_results]
+
+
 def compute_rewards_from_paths(all_paths, key='rewards', as_goal=True, env=None, terminal_eps=0.1):
     all_rewards = []
     all_states = []
@@ -185,6 +292,74 @@ def label_states(states, env, policy, horizon, as_goals=True, min_reward=0.1, ma
     return labels
 
 
+def index_paths_by_state(states, all_paths, as_goals=True, env=None, match_eps=1e-6):
+    """
+    Group the collected paths by the state (goal or start) they were collected from.
+    :param states: states to look the paths for
+    :param all_paths: list of lists of paths, as returned by algo.train()
+    :param match_eps: max distance between the state of a path and the state it is assigned to
+    :return: a list with, for each state, the list of its paths
+    """
+    paths_by_state = [[] for _ in states]
+    paths = [path for paths in all_paths for path in paths]
+    if len(states) == 0 or len(paths) == 0:
+        return paths_by_state
+    path_states = []
+    for path in paths:
+        if as_goals:
+            path_states.append(path['env_infos']['goal'][0])
+        else:
+            env_infos_first_time_step = {key: value[0] for key, value in path['env_infos'].items()}
+            path_states.append(env.transform_to_start_space(path['observations'][0], env_infos_first_time_step))
+    dists, indices = scipy.spatial.cKDTree(np.array(states)).query(np.array(path_states), k=1)
+    for path, dist, idx in zip(paths, dists, indices):
+        if dist <= match_eps:
+            paths_by_state[idx].append(path)
+    return paths_by_state
+
+
+def label_states_reusing_paths(states, all_paths, env, policy, horizon, as_goals=True, min_reward=0.1, max_reward=0.9,
+                               key='rewards', old_rewards=None, improvement_threshold=0.1, n_traj=1, n_processes=-1,
+                               full_path=False, return_rew=False, match_eps=1e-6):
+    """
+    Same as label_states, but the paths already collected from the states (for instance by the training algo) are
+    used as the first trajectories of each state, and only the missing ones are rolled out.
+    """
+    logger.log("Labelling starts reusing the collected paths")
+    paths_by_state = index_paths_by_state(states, all_paths, as_goals=as_goals, env=env, match_eps=match_eps)
+    paths_by_state = [state_paths[:n_traj] for state_paths in paths_by_state]
+    missing_idx = [i for i, state_paths in enumerate(paths_by_state) for _ in range(n_traj - len(state_paths))]
+    logger.log("Reusing {} trajectories, rolling out {} more".format(
+        len(states) * n_traj - len(missing_idx), len(missing_idx)))
+
+    traj_rewards = [[evaluate_path(path, key=key) for path in state_paths] for state_paths in paths_by_state]
+    if len(missing_idx) > 0:
+        result = evaluate_states(
+            [states[i] for i in missing_idx], env, policy, horizon, as_goals=as_goals,
+            n_traj=1, n_processes=n_processes, key=key, full_path=full_path
+        )
+        if full_path:
+            missing_rewards, missing_paths = result
+            for i, path in zip(missing_idx, missing_paths):
+                paths_by_state[i].append(path)
+        else:
+            missing_rewards = result
+        for i, reward in zip(missing_idx, missing_rewards):
+            traj_rewards[i].append(reward)
+    logger.log("Evaluated states.")
+
+    mean_rewards = np.array([np.mean(rewards) for rewards in traj_rewards]).reshape(-1, 1)
+    labels = compute_labels(mean_rewards, old_rewards=old_rewards, min_reward=min_reward, max_reward=max_reward,
+                            improvement_threshold=improvement_threshold)
+    logger.log("Starts labelled")
+
+    if full_path:
+        return labels, [path for state_paths in paths_by_state for path in state_paths]
+    elif return_rew:
+        return labels, mean_rewards
+    return labels
+
+
 def compute_labels(mean_rewards, old_rewards=None, min_reward=0.1, max_reward=0.9, improvement_threshold=0.1):
     logger.log("Computing state labels")
     if old_rewards is not None:
@@ -242,10 +417,7 @@ def convert_label(labels):
 def evaluate_states(states, env, policy, horizon, n_traj=1, n_processes=-1, full_path=False, key='rewards',
                     as_goals=True,
                     aggregator=(np.sum, np.mean)):
-    evaluate_state_wrapper = FunctionWrapper(
-        evaluate_state,
-        env=env,
-        policy=policy,
+    evaluate_kwargs = dict(
         horizon=horizon,
         n_traj=n_traj,
         full_path=full_path,
@@ -253,11 +425,15 @@ def evaluate_states(states, env, policy, horizon, n_traj=1, n_processes=-1, full
         as_goals=as_goals,
         aggregator=aggregator,
     )
-    result = parallel_map(  # if full_path this is a list of tuples
-        evaluate_state_wrapper,
-        states,
-        n_processes,
-    )
+    if n_processes == -1:
+        result = resident_map(evaluate_state, states, env, policy, **evaluate_kwargs)
+    else:
+        evaluate_state_wrapper = FunctionWrapper(evaluate_state, env=env, policy=policy, **evaluate_kwargs)
+        result = parallel_map(  # if full_path this is a list of tuples
+            evaluate_state_wrapper,
+            states,
+            n_processes,
+        )
 
     if full_path:
         return np.array([state[0] for state in result]), [path for state in result for path in state[1]]
@@ -294,11 +470,14 @@ def evaluate_state(state, env, policy, horizon, n_traj=1, full_path=False, key='
 
 
 def evaluate_state_env(env, policy, horizon, n_states=10, n_traj=1, n_processes=-1, **kwargs):
-    evaluate_env_wrapper = FunctionWrapper(
-        rollout,
-        env=env, agent=policy, max_path_length=horizon,
-    )
-    paths = parallel_map(evaluate_env_wrapper, [None] * n_states, n_processes)
+    if n_processes == -1:
+        paths = resident_map(rollout, [None] * n_states, env, policy, policy_kwarg='agent', max_path_length=horizon)
+    else:
+        evaluate_env_wrapper = FunctionWrapper(
+            rollout,
+            env=env, agent=policy, max_path_length=horizon,
+        )
+        paths = parallel_map(evaluate_env_wrapper, [None] * n_states, n_processes)
 
     # paths = [rollout(env=env, agent=policy, max_path_length=horizon) for _ in range(n_states)]
     env.log_diagnostics(paths, n_traj=n_traj, **kwargs)
@@ -15,7 +15,58 @@ import matplotlib.pyplot as plt
 
 import numpy as np
 import scipy.misc
-from curriculum.state.evaluator import parallel_map, disable_cuda_initializer
+
+
+class RadiusIndex(object):
+    """
+    Incremental spatial index answering whether points have an indexed neighbor within a given radius.
+    The points are kept in KD-trees whose sizes are powers of two: inserting merges the trees of equal size and
+    rebuilds them in one batch, so appending N points costs O(N log^2 N) and each query checks O(log N) trees.
+    """
+
+    def __init__(self, radius):
+        self.radius = radius
+        self._blocks = []  # list of (points, tree), with decreasing number of points
+
+    def __len__(self):
+        return sum(len(points) for points, _ in self._blocks)
+
+    def add(self, points):
+        points = np.asarray(points, dtype=float)
+        if len(points) == 0:
+            return
+        while len(self._blocks) > 0 and len(self._blocks[-1][0]) <= len(points):
+            points = np.concatenate([self._blocks.pop()[0], points])
+        self._blocks.append((points, scipy.spatial.cKDTree(points)))
+
+    def has_neighbor(self, points):
+        """ Boolean array marking the points at distance <= radius of an indexed point. """
+        points = np.asarray(points, dtype=float)
+        near = np.zeros(len(points), dtype=bool)
+        for _, tree in self._blocks:
+            dists, _ = tree.query(points, k=1)
+            near |= dists <= self.radius
+        return near
+
+    def select_separated(self, points, chunk_size=512):
+        """
+        Indices of the points kept by adding them greedily, in order, to this index: a point is kept (and indexed)
+        only if it is at more than radius from all the points indexed so far.
+        """
+        points = np.asarray(points, dtype=float)
+        kept = []
+        for chunk_start in range(0, len(points), chunk_size):
+            chunk = points[chunk_start: chunk_start + chunk_size]
+            rejected = self.has_neighbor(chunk)
+            close = scipy.spatial.distance.cdist(chunk, chunk) <= self.radius
+            chunk_kept = []
+            for i in range(len(chunk)):
+                if not rejected[i]:
+                    chunk_kept.append(i)
+                    rejected |= close[i]
+            self.add(chunk[chunk_kept])
+            kept.extend(chunk_start + i for i in chunk_kept)
+        return np.array(kept, dtype=int)
 
 
 class StateCollection(object):
@@ -28,6 +79,20 @@ class StateCollection(object):
         self.idx_lim = idx_lim
         if self.states_transform:
             self.transformed_state_list = []
+        self._index = RadiusIndex(distance_threshold)
+        self._states_array = None
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        if "_index" not in d:
+            # pickled before the spatial index was added: index the states already in the collection
+            self._index = RadiusIndex(self.distance_threshold)
+            self._states_array = None
+            if self.distance_threshold is not None and self.distance_threshold > 0 and len(self.state_list) > 0:
+                if self.states_transform:
+                    self._index.add(np.array(self.transformed_state_list))
+                else:
+                    self._index.add(np.array(self.state_list)[:, :self.idx_lim])
 
     @property
     def size(self):
@@ -35,76 +100,49 @@ class StateCollection(object):
 
     def empty(self):
         self.state_list = []
+        if self.states_transform:
+            self.transformed_state_list = []
+        self._index = RadiusIndex(self.distance_threshold)
+        self._states_array = None
 
     def sample(self, size, replace=False, replay_noise=0):
-        states = sample_matrix_row(np.array(self.state_list), size, replace)
+        states = sample_matrix_row(self.states, size, replace)
+        if states is self._states_array:  # the whole collection was returned: don't let the caller modify the cache
+            states = states.copy()
         if replay_noise > 0:
             states += replay_noise * np.random.randn(*states.shape)
         return states
 
     def append(self, states, n_process=None):
+        """
+        Append the states that are at more than distance_threshold from the collection and from each other (in the
+        order given). Returns the appended states.
+        :param n_process: unused, the spatial index makes the selection cheap enough to run in the master process
+        """
         if self.states_transform:
             return self.append_states_transform(states)
         if len(states) > 0:
             states = np.array(states)
             logger.log("we are trying to append states: {}".format(states.shape))
             if self.distance_threshold is not None and self.distance_threshold > 0:
-                states = self._process_states(states)
-            logger.log("after processing, we are left with : {}".format(states.shape))
-            if n_process is None:
-                n_process = singleton_pool.n_parallel
-            elif n_process in [-1, 0]:
-                n_process = 1
-            if states.shape[0] >= n_process > 1:
-                states_per_process = states.shape[0] // singleton_pool.n_parallel
-                list_of_states = [states[i * states_per_process: (i+1) * states_per_process, :] for i in range(n_process-1)]
-                list_of_states.append(states[states_per_process * (n_process - 1):, :])
-                states = parallel_map(self._select_states, list_of_states)
-                states = np.concatenate(states)
-            else:
                 states = self._select_states(states)
+            logger.log("after processing, we are left with : {}".format(states.shape))
             self.state_list.extend(states.tolist())
+            self._states_array = None
             return states
 
     def _select_states(self, states):
-        # print('selecting states from shape: ', states.shape)
-        selected_states = states
-        selected_states_idx_lim = np.array([state[:self.idx_lim] for state in states])
-        # print('selecting states from shape (after idx_lim of ', self.idx_lim, ': ', selected_states_idx_lim.shape)
-        state_list_idx_lim = np.array([state[:self.idx_lim] for state in self.state_list])
-        # print('the state_list_idx_lim shape: ', np.shape(self.state_list))
-        if self.distance_threshold is not None and self.distance_threshold > 0:
-            if len(self.state_list) > 0:
-                dists = scipy.spatial.distance.cdist(state_list_idx_lim, selected_states_idx_lim)
-                indices = np.amin(dists, axis=0) > self.distance_threshold
-                selected_states = selected_states[indices, :]
-        # print('the selected states are: {}'.format(selected_states.shape))
-        return selected_states
+        "keep only the states that are at more than dist_threshold from each other and from the collection"
+        # idx_lim allows you to maintain full state information while disregarding the last dims for the distance
+        states_idx_lim = states[:, :self.idx_lim]
+        processed = self._process_states(states_idx_lim)
+        selected = processed[~self._index.has_neighbor(states_idx_lim[processed])]
+        self._index.add(states_idx_lim[selected])
+        return states[selected, :]
 
     def _process_states(self, states):
-        "keep only the states that are at more than dist_threshold from each other"
-        # adding a states transform allows you to maintain full state information while possibly disregarding some dim
-        states = np.array(states)
-        results = [states[0]]
-        results_idx_lim = [states[0][:self.idx_lim]]
-        for i, state in enumerate(states[1:]):
-            # print("analyzing state : ", i)
-            if np.amin(scipy.spatial.distance.cdist(results_idx_lim, state.reshape(1, -1)[:self.idx_lim])) > self.distance_threshold:
-                results.append(state)
-                results_idx_lim.append(state[:self.idx_lim])
-        return np.array(results)
-
-    def _process_states_transform(self, states, transformed_states):
-        "keep only the states that are at more than dist_threshold from each other"
-        # adding a states transform allows you to maintain full state information while possibly disregarding some dim
-        results = [states[0]]
-        transformed_results = [transformed_states[0]]
-        for i in range(1, len(states)):
-            # checks if valid in transformed space
-            if np.amin(scipy.spatial.distance.cdist(transformed_results, transformed_states[i].reshape(1, -1))) > self.distance_threshold:
-                results.append(states[i])
-                transformed_results.append(transformed_states[i])
-        return np.array(results), np.array(transformed_results)
+        "indices of the states that are at more than dist_threshold from the previous ones kept"
+        return RadiusIndex(self.distance_threshold).select_separated(states)
 
     def append_states_transform(self, states):
         assert self.idx_lim is None, "Can't use state transform and idx_lim with StateCollection!"
@@ -112,15 +150,15 @@ class StateCollection(object):
             states = np.array(states)
             transformed_states = self.states_transform(states)
             if self.distance_threshold is not None and self.distance_threshold > 0:
-                states, transformed_states = self._process_states_transform(states, transformed_states)
-                if len(self.state_list) > 0:
-                    print("hi")
-                    dists = scipy.spatial.distance.cdist(self.transformed_state_list, transformed_states)
-                    indices = np.amin(dists, axis=0) > self.distance_threshold
-                    states = states[indices, :]
-                    transformed_states = transformed_states[indices, :]
+                # checks if valid in transformed space
+                processed = self._process_states(transformed_states)
+                selected = processed[~self._index.has_neighbor(transformed_states[processed])]
+                self._index.add(transformed_states[selected])
+                states = states[selected, :]
+                transformed_states = transformed_states[selected, :]
             self.state_list.extend(states)
             self.transformed_state_list.extend(transformed_states)
+            self._states_array = None
             assert(len(self.state_list) == len(self.transformed_state_list))
         return states # modifed to return added states
 
@@ -140,7 +178,9 @@ class StateCollection(object):
 
     @property
     def states(self):
-        return np.array(self.state_list)
+        if self._states_array is None or len(self._states_array) != len(self.state_list):
+            self._states_array = np.array(self.state_list)
+        return self._states_array
 
 class SmartStateCollection(StateCollection):
     # should be used same as before, just need to update Q values
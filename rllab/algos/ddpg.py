@@ -8,7 +8,15 @@ from functools import partial
 import rllab.misc.logger as logger
 import theano.tensor as TT
 import pickle as pickle
+from rllab.sampler.shared_memory import SharedArray
+import multiprocessing as mp
+import queue
 import numpy as np
+import os
+import os.path as osp
+import tempfile
+import time
+import uuid
 import pyprind
 import lasagne
 
@@ -24,21 +32,24 @@ def parse_update_method(update_method, **kwargs):
 
 class SimpleReplayPool(object):
     def __init__(
-            self, max_pool_size, observation_dim, action_dim):
+            self, max_pool_size, observation_dim, action_dim, dtype=np.float32):
         self._observation_dim = observation_dim
         self._action_dim = action_dim
         self._max_pool_size = max_pool_size
+        self._allocate_buffers(dtype)
+        self._bottom = 0
+        self._top = 0
+        self._size = 0
+
+    def _allocate_buffers(self, dtype):
         self._observations = np.zeros(
-            (max_pool_size, observation_dim),
+            (self._max_pool_size, self._observation_dim), dtype=dtype
         )
         self._actions = np.zeros(
-            (max_pool_size, action_dim),
+            (self._max_pool_size, self._action_dim), dtype=dtype
         )
-        self._rewards = np.zeros(max_pool_size)
-        self._terminals = np.zeros(max_pool_size, dtype='uint8')
-        self._bottom = 0
-        self._top = 0
-        self._size = 0
+        self._rewards = np.zeros(self._max_pool_size, dtype=dtype)
+        self._terminals = np.zeros(self._max_pool_size, dtype='uint8')
 
     def add_sample(self, observation, action, reward, terminal):
         self._observations[self._top] = observation
@@ -51,36 +62,260 @@ class SimpleReplayPool(object):
         else:
             self._size += 1
 
-    def random_batch(self, batch_size):
+    def add_samples(self, observations, actions, rewards, terminals):
+        """
+        Add consecutive samples at once, such as a whole path.
+        """
+        n = len(rewards)
+        # samples that would be overwritten within this call are skipped
+        skip = max(0, n - self._max_pool_size)
+        indices = (self._top + np.arange(skip, n)) % self._max_pool_size
+        self._observations[indices] = observations[skip:]
+        self._actions[indices] = actions[skip:]
+        self._rewards[indices] = rewards[skip:]
+        self._terminals[indices] = terminals[skip:]
+        self._top = (self._top + n) % self._max_pool_size
+        n_overwritten = max(0, self._size + n - self._max_pool_size)
+        self._bottom = (self._bottom + n_overwritten) % self._max_pool_size
+        self._size += n - n_overwritten
+
+    def random_batch(self, batch_size, out=None):
+        """
+        Sample batch_size transitions uniformly.
+        :param out: batch returned by a previous call with the same batch_size, whose arrays are filled instead of
+        allocating new ones. It must no longer be in use.
+        """
         assert self._size > batch_size
-        indices = np.zeros(batch_size, dtype='uint64')
-        transition_indices = np.zeros(batch_size, dtype='uint64')
-        count = 0
-        while count < batch_size:
-            index = np.random.randint(self._bottom, self._bottom + self._size) % self._max_pool_size
-            # make sure that the transition is valid: if we are at the end of the pool, we need to discard
-            # this sample
-            if index == self._size - 1 and self._size <= self._max_pool_size:
-                continue
-            # if self._terminals[index]:
-            #     continue
-            transition_index = (index + 1) % self._max_pool_size
-            indices[count] = index
-            transition_indices[count] = transition_index
-            count += 1
-        return dict(
-            observations=self._observations[indices],
-            actions=self._actions[indices],
-            rewards=self._rewards[indices],
-            terminals=self._terminals[indices],
-            next_observations=self._observations[transition_indices]
-        )
+        # the most recent sample has no next observation yet, so only the size - 1 older ones are valid transitions
+        offsets = np.random.randint(0, self._size - 1, size=batch_size)
+        indices = (self._bottom + offsets) % self._max_pool_size
+        transition_indices = (indices + 1) % self._max_pool_size
+        if out is None:
+            return dict(
+                observations=np.take(self._observations, indices, axis=0),
+                actions=np.take(self._actions, indices, axis=0),
+                rewards=np.take(self._rewards, indices),
+                terminals=np.take(self._terminals, indices),
+                next_observations=np.take(self._observations, transition_indices, axis=0),
+            )
+        np.take(self._observations, indices, axis=0, out=out["observations"])
+        np.take(self._actions, indices, axis=0, out=out["actions"])
+        np.take(self._rewards, indices, out=out["rewards"])
+        np.take(self._terminals, indices, out=out["terminals"])
+        np.take(self._observations, transition_indices, axis=0, out=out["next_observations"])
+        return out
 
     @property
     def size(self):
         return self._size
 
 
+class MemmapReplayPool(SimpleReplayPool):
+    """
+    SimpleReplayPool whose buffers are memory-mapped files, so the pool can be larger than the RAM. Pickling it only
+    stores the ring pointers and the names of the files, which makes snapshots cheap; unpickling maps the same files
+    again. The files keep being written after a snapshot, so only the latest snapshot is consistent with them.
+    """
+
+    _BUFFERS = ["observations", "actions", "rewards", "terminals"]
+
+    def __init__(
+            self, max_pool_size, observation_dim, action_dim, dtype=np.float32, directory=None, prefix=None):
+        """
+        :param directory: where to create the files, by default the snapshot directory of the logger, or a new
+        temporary folder if it is not set
+        :param prefix: prefix of the file names, by default one unique to the pool, so that several pools can share
+        a directory
+        """
+        if directory is None:
+            directory = logger.get_snapshot_dir() or tempfile.mkdtemp(prefix="rllab_replay_")
+        if prefix is None:
+            prefix = "replay_pool_%d_%s" % (os.getpid(), uuid.uuid4().hex[:8])
+        self._directory = directory
+        self._prefix = prefix
+        self._dtype = np.dtype(dtype)
+        super(MemmapReplayPool, self).__init__(max_pool_size, observation_dim, action_dim, dtype=dtype)
+
+    @overrides
+    def _allocate_buffers(self, dtype):
+        self._map_buffers(mode='w+')
+
+    def _buffer_shapes(self):
+        return dict(
+            observations=((self._max_pool_size, self._observation_dim), self._dtype),
+            actions=((self._max_pool_size, self._action_dim), self._dtype),
+            rewards=((self._max_pool_size,), self._dtype),
+            terminals=((self._max_pool_size,), np.dtype('uint8')),
+        )
+
+    def _buffer_filename(self, name):
+        return osp.join(self._directory, "%s_%s.dat" % (self._prefix, name))
+
+    def _map_buffers(self, mode):
+        # 'w+' creates sparse files, so disk space is only used as the pool fills up
+        for name, (shape, dtype) in self._buffer_shapes().items():
+            setattr(self, "_" + name, np.memmap(self._buffer_filename(name), dtype=dtype, mode=mode, shape=shape))
+
+    def flush(self):
+        for name in self._BUFFERS:
+            getattr(self, "_" + name).flush()
+
+    def __getstate__(self):
+        self.flush()
+        return dict(
+            max_pool_size=self._max_pool_size,
+            observation_dim=self._observation_dim,
+            action_dim=self._action_dim,
+            dtype=self._dtype.str,
+            directory=self._directory,
+            prefix=self._prefix,
+            bottom=self._bottom,
+            top=self._top,
+            size=self._size,
+        )
+
+    def __setstate__(self, d):
+        self._max_pool_size = d["max_pool_size"]
+        self._observation_dim = d["observation_dim"]
+        self._action_dim = d["action_dim"]
+        self._dtype = np.dtype(d["dtype"])
+        self._directory = d["directory"]
+        self._prefix = d["prefix"]
+        self._bottom = d["bottom"]
+        self._top = d["top"]
+        self._size = d["size"]
+        # the snapshot may have been moved together with the pool files, e.g. when copied from a remote machine
+        snapshot_dir = logger.get_snapshot_dir()
+        if not osp.exists(self._buffer_filename("observations")) and snapshot_dir is not None:
+            self._directory = snapshot_dir
+        self._map_buffers(mode='r+')
+
+
+def _run_actor(actor_id, pickled, shared_params, params_version, path_queue, stop_event, max_path_length,
+               scale_reward, include_horizon_terminal_transitions, seed):
+    """
+    Loop of an actor process: roll out the exploration strategy and send each finished path to the learner, with the
+    samples it would have added to the replay pool in the synchronous mode.
+    """
+    if seed is not None:
+        ext.set_seed(seed + actor_id + 1)
+    else:
+        np.random.seed()
+    env, policy, es = pickle.loads(pickled)
+    version = -1
+    itr = 0
+    while not stop_event.is_set():
+        observation = env.reset()
+        es.reset()
+        policy.reset()
+        observations, actions, rewards, terminals = [], [], [], []
+        path_length = 0
+        path_return = 0
+        terminal = False
+        while not terminal and not stop_event.is_set():
+            if params_version.value != version:
+                with params_version.get_lock():
+                    version = params_version.value
+                    policy.set_param_values(shared_params.array)
+            action = es.get_action(itr, observation, policy=policy)
+            next_observation, reward, terminal, _ = env.step(action)
+            path_length += 1
+            path_return += reward
+            itr += 1
+            if terminal or path_length < max_path_length or include_horizon_terminal_transitions:
+                observations.append(observation)
+                actions.append(action)
+                rewards.append(reward * scale_reward)
+                terminals.append(terminal or path_length >= max_path_length)
+            terminal = terminal or path_length >= max_path_length
+            observation = next_observation
+        if not terminal or len(rewards) == 0:
+            continue
+        path = (np.array(observations), np.array(actions), np.array(rewards), np.array(terminals), path_return,
+                path_length)
+        while not stop_event.is_set():
+            try:
+                path_queue.put(path, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+
+class ActorPool(object):
+    """
+    Actor processes that fill the replay pool of an asynchronous DDPG learner. Each actor has its own copy of the
+    env, policy and exploration strategy, and reads the policy parameters from shared memory whenever the learner
+    pushes new ones. Finished paths are sent through a bounded queue, so actors can not run too far ahead of the
+    learner.
+    """
+
+    def __init__(self, env, policy, es, n_actors, max_path_length, scale_reward=1.0,
+                 include_horizon_terminal_transitions=False, queue_size=100):
+        self.n_actors = n_actors
+        self._pickled = pickle.dumps((env, policy, es))
+        self._max_path_length = max_path_length
+        self._scale_reward = scale_reward
+        self._include_horizon_terminal_transitions = include_horizon_terminal_transitions
+        self._shared_params = SharedArray(len(policy.get_param_values()))
+        self._shared_params.array[:] = policy.get_param_values()
+        self._params_version = mp.Value('i', 0)
+        self._path_queue = mp.Queue(maxsize=queue_size)
+        self._stop_event = mp.Event()
+        self._processes = []
+
+    def start(self):
+        for actor_id in range(self.n_actors):
+            process = mp.Process(
+                target=_run_actor,
+                args=(actor_id, self._pickled, self._shared_params, self._params_version, self._path_queue,
+                      self._stop_event, self._max_path_length, self._scale_reward,
+                      self._include_horizon_terminal_transitions, ext.get_seed()),
+            )
+            process.daemon = True
+            process.start()
+            self._processes.append(process)
+        # the actors are forked with the mapping, so the file is not needed anymore
+        self._shared_params.unlink()
+
+    def push_params(self, params):
+        with self._params_version.get_lock():
+            self._shared_params.array[:] = params
+            self._params_version.value += 1
+
+    def collect(self, pool):
+        """
+        Add the paths sent by the actors since the last call to the replay pool. Return the number of env steps
+        the actors took and the returns of the paths.
+        """
+        n_steps = 0
+        path_returns = []
+        while True:
+            try:
+                observations, actions, rewards, terminals, path_return, path_length = self._path_queue.get_nowait()
+            except queue.Empty:
+                break
+            pool.add_samples(observations, actions, rewards, terminals)
+            n_steps += path_length
+            path_returns.append(path_return)
+        if n_steps == 0:
+            for process in self._processes:
+                if not process.is_alive():
+                    raise RuntimeError("DDPG actor exited with code %s" % process.exitcode)
+        return n_steps, path_returns
+
+    def stop(self):
+        self._stop_event.set()
+        # keep emptying the queue, or actors blocked on flushing it would never exit
+        while any(process.is_alive() for process in self._processes):
+            try:
+                self._path_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for process in self._processes:
+            process.join()
+        self._processes = []
+
+
 class DDPG(RLAlgorithm):
     """
     Deep Deterministic Policy Gradient.
@@ -97,6 +332,7 @@ class DDPG(RLAlgorithm):
             epoch_length=1000,
             min_pool_size=10000,
             replay_pool_size=1000000,
+            memmap_replay_pool=False,
             discount=0.99,
             max_path_length=250,
             qf_weight_decay=0.,
@@ -111,6 +347,9 @@ class DDPG(RLAlgorithm):
             n_updates_per_sample=1,
             scale_reward=1.0,
             include_horizon_terminal_transitions=False,
+            n_actors=0,
+            actor_param_sync_interval=100,
+            actor_queue_size=100,
             plot=False,
             pause_for_plot=False):
         """
@@ -123,6 +362,8 @@ class DDPG(RLAlgorithm):
         :param epoch_length: How many timesteps for each epoch.
         :param min_pool_size: Minimum size of the pool to start training.
         :param replay_pool_size: Size of the experience replay pool.
+        :param memmap_replay_pool: Whether to keep the replay pool in memory-mapped files of the snapshot directory
+        instead of RAM. The pool is then part of the snapshots, which only store its pointers and file names.
         :param discount: Discount factor for the cumulative return.
         :param max_path_length: Discount factor for the cumulative return.
         :param qf_weight_decay: Weight decay factor for parameters of the Q function.
@@ -137,6 +378,12 @@ class DDPG(RLAlgorithm):
         :param scale_reward: The scaling factor applied to the rewards when training
         :param include_horizon_terminal_transitions: whether to include transitions with terminal=True because the
         horizon was reached. This might make the Q value back up less stable for certain tasks.
+        :param n_actors: Number of actor processes filling the replay pool while the learner trains. With 0, env steps
+        and updates are interleaved on the same thread. With actors, an epoch is epoch_length * n_updates_per_sample
+        updates of the learner.
+        :param actor_param_sync_interval: Number of learner updates between pushes of the policy parameters to the
+        actors.
+        :param actor_queue_size: Number of paths the actors can send ahead of the learner.
         :param plot: Whether to visualize the policy performance after each eval_interval.
         :param pause_for_plot: Whether to pause before continuing when plotting.
         :return:
@@ -150,6 +397,7 @@ class DDPG(RLAlgorithm):
         self.epoch_length = epoch_length
         self.min_pool_size = min_pool_size
         self.replay_pool_size = replay_pool_size
+        self.memmap_replay_pool = memmap_replay_pool
         self.discount = discount
         self.max_path_length = max_path_length
         self.qf_weight_decay = qf_weight_decay
@@ -170,6 +418,9 @@ class DDPG(RLAlgorithm):
         self.soft_target_tau = soft_target_tau
         self.n_updates_per_sample = n_updates_per_sample
         self.include_horizon_terminal_transitions = include_horizon_terminal_transitions
+        self.n_actors = n_actors
+        self.actor_param_sync_interval = actor_param_sync_interval
+        self.actor_queue_size = actor_queue_size
         self.plot = plot
         self.pause_for_plot = pause_for_plot
 
@@ -191,20 +442,31 @@ class DDPG(RLAlgorithm):
             plotter.init_plot(self.env, self.policy)
 
     @overrides
-    def train(self):
+    def train(self, replay_pool=None):
+        """
+        :param replay_pool: Replay pool to continue filling, such as the one of a snapshot when resuming training. It
+        is not an argument of the constructor, so that it is never pickled with the algorithm.
+        """
         # This seems like a rather sequential method
-        pool = SimpleReplayPool(
-            max_pool_size=self.replay_pool_size,
-            observation_dim=self.env.observation_space.flat_dim,
-            action_dim=self.env.action_space.flat_dim,
-        )
+        pool = replay_pool
+        if pool is None:
+            pool_cls = MemmapReplayPool if self.memmap_replay_pool else SimpleReplayPool
+            pool = pool_cls(
+                max_pool_size=self.replay_pool_size,
+                observation_dim=self.env.observation_space.flat_dim,
+                action_dim=self.env.action_space.flat_dim,
+            )
         self.start_worker()
 
         self.init_opt()
+        if self.n_actors > 0:
+            self.train_async(pool)
+            return
         itr = 0
         path_length = 0
         path_return = 0
         terminal = False
+        batch = None
         observation = self.env.reset()
 
         sample_policy = pickle.loads(pickle.dumps(self.policy))
@@ -242,8 +504,8 @@ class DDPG(RLAlgorithm):
 
                 if pool.size >= self.min_pool_size:
                     for update_itr in range(self.n_updates_per_sample):
-                        # Train policy
-                        batch = pool.random_batch(self.batch_size)
+                        # Train policy, reusing the arrays of the previous batch
+                        batch = pool.random_batch(self.batch_size, out=batch)
                         self.do_training(itr, batch)
                     sample_policy.set_param_values(self.policy.get_param_values())
 
@@ -252,7 +514,7 @@ class DDPG(RLAlgorithm):
             logger.log("Training finished")
             if pool.size >= self.min_pool_size:
                 self.evaluate(epoch, pool)
-                params = self.get_epoch_snapshot(epoch)
+                params = self.get_epoch_snapshot(epoch, pool)
                 logger.save_itr_params(epoch, params)
             logger.dump_tabular(with_prefix=False)
             logger.pop_prefix()
@@ -264,6 +526,63 @@ class DDPG(RLAlgorithm):
         self.env.terminate()
         self.policy.terminate()
 
+    def train_async(self, pool):
+        actors = ActorPool(
+            self.env, self.policy, self.es, self.n_actors, self.max_path_length, scale_reward=self.scale_reward,
+            include_horizon_terminal_transitions=self.include_horizon_terminal_transitions,
+            queue_size=self.actor_queue_size,
+        )
+        actors.start()
+        try:
+            logger.log("Waiting for the actors to fill the replay pool")
+            while pool.size < self.min_pool_size:
+                n_steps, path_returns = actors.collect(pool)
+                self.es_path_returns.extend(path_returns)
+                if n_steps == 0:
+                    time.sleep(0.01)
+
+            itr = 0
+            batch = None
+            for epoch in range(self.n_epochs):
+                logger.push_prefix('epoch #%d | ' % epoch)
+                logger.log("Training started")
+                start_time = time.time()
+                epoch_steps = 0
+                epoch_updates = 0
+                for epoch_itr in pyprind.prog_bar(range(self.epoch_length)):
+                    n_steps, path_returns = actors.collect(pool)
+                    epoch_steps += n_steps
+                    self.es_path_returns.extend(path_returns)
+                    for update_itr in range(self.n_updates_per_sample):
+                        batch = pool.random_batch(self.batch_size, out=batch)
+                        self.do_training(itr, batch)
+                        epoch_updates += 1
+                        if epoch_updates % self.actor_param_sync_interval == 0:
+                            actors.push_params(self.policy.get_param_values())
+                    itr += 1
+                train_time = time.time() - start_time
+                logger.log("Training finished")
+
+                self.evaluate(epoch, pool)
+                # env steps taken by the actors per update of the learner, 1 / n_updates_per_sample in the
+                # synchronous mode
+                logger.record_tabular('ActorStepsPerSec', epoch_steps / train_time)
+                logger.record_tabular('LearnerUpdatesPerSec', epoch_updates / train_time)
+                logger.record_tabular('ActorLearnerRatio', epoch_steps / epoch_updates)
+                params = self.get_epoch_snapshot(epoch, pool)
+                logger.save_itr_params(epoch, params)
+                logger.dump_tabular(with_prefix=False)
+                logger.pop_prefix()
+                if self.plot:
+                    self.update_plot()
+                    if self.pause_for_plot:
+                        input("Plotting evaluation run: Press Enter to "
+                              "continue...")
+        finally:
+            actors.stop()
+        self.env.terminate()
+        self.policy.terminate()
+
     def init_opt(self):
 
         # First, create "target" policy and Q functions
@@ -321,9 +640,24 @@ class DDPG(RLAlgorithm):
             updates=policy_updates
         )
 
+        # soft target update, applied to the shared variables in place rather than through get/set_param_values
+        target_updates = []
+        for target, source in [(target_policy, self.policy), (target_qf, self.qf)]:
+            for target_param, param in zip(target.get_params(), source.get_params()):
+                target_updates.append((
+                    target_param,
+                    (target_param * (1.0 - self.soft_target_tau) + param * self.soft_target_tau).astype(
+                        target_param.dtype)
+                ))
+        f_update_targets = ext.compile_function(
+            inputs=[],
+            updates=target_updates
+        )
+
         self.opt_info = dict(
             f_train_qf=f_train_qf,
             f_train_policy=f_train_policy,
+            f_update_targets=f_update_targets,
             target_qf=target_qf,
             target_policy=target_policy,
         )
@@ -352,12 +686,7 @@ class DDPG(RLAlgorithm):
 
         policy_surr = f_train_policy(obs)
 
-        target_policy.set_param_values(
-            target_policy.get_param_values() * (1.0 - self.soft_target_tau) +
-            self.policy.get_param_values() * self.soft_target_tau)
-        target_qf.set_param_values(
-            target_qf.get_param_values() * (1.0 - self.soft_target_tau) +
-            self.qf.get_param_values() * self.soft_target_tau)
+        self.opt_info["f_update_targets"]()
 
         self.qf_loss_averages.append(qf_loss)
         self.policy_surr_averages.append(policy_surr)
@@ -443,8 +772,8 @@ class DDPG(RLAlgorithm):
         if self.plot:
             plotter.update_plot(self.policy, self.max_path_length)
 
-    def get_epoch_snapshot(self, epoch):
-        return dict(
+    def get_epoch_snapshot(self, epoch, pool=None):
+        snapshot = dict(
             env=self.env,
             epoch=epoch,
             qf=self.qf,
@@ -453,3 +782,7 @@ class DDPG(RLAlgorithm):
             target_policy=self.opt_info["target_policy"],
             es=self.es,
         )
+        # an in-memory pool would put the whole buffers in every snapshot
+        if isinstance(pool, MemmapReplayPool):
+            snapshot["replay_pool"] = pool
+        return snapshot
@@ -72,13 +72,16 @@ class NPO(BatchPolopt):
         dist_info_vars = self.policy.dist_info_sym(obs_var, state_info_vars)
         kl = dist.kl_sym(old_dist_info_vars, dist_info_vars)
         lr = dist.likelihood_ratio_sym(action_var, old_dist_info_vars, dist_info_vars)
+        logli = dist.log_likelihood_sym(action_var, dist_info_vars)
         if self.truncate_local_is_ratio is not None:
             lr = TT.minimum(self.truncate_local_is_ratio, lr)
         if is_recurrent:
             mean_kl = TT.sum(kl * valid_var) / TT.sum(valid_var)
+            mean_logli = TT.sum(logli * valid_var) / TT.sum(valid_var)
             surr_loss = - TT.sum(lr * advantage_var * valid_var) / TT.sum(valid_var)
         else:
             mean_kl = TT.mean(kl)
+            mean_logli = TT.mean(logli)
             surr_loss = - TT.mean(lr * advantage_var)
 
         input_list = [
@@ -94,10 +97,26 @@ class NPO(BatchPolopt):
             target=self.policy,
             leq_constraint=(mean_kl, self.step_size),
             inputs=input_list,
-            constraint_name="mean_kl"
+            constraint_name="mean_kl",
+            cache_key=self._compile_cache_key(),
+            precondition_loglik=mean_logli,
         )
         return dict()
 
+    def _compile_cache_key(self):
+        """
+        Everything other than the policy that the symbolic loss, constraint and inputs of init_opt depend on, so that
+        optimizers supporting it reuse their compiled functions when a new algo is built for the same policy.
+        """
+        spaces_key = tuple(
+            (type(space), space.flat_dim) for space in [self.env.observation_space, self.env.action_space]
+        )
+        return (
+            type(self), spaces_key, self.policy.recurrent, type(self.policy.distribution),
+            tuple(self.policy.distribution.dist_info_keys), tuple(self.policy.state_info_keys),
+            self.truncate_local_is_ratio,
+        )
+
     @overrides
     def optimize_policy(self, itr, samples_data):
         all_input_values = tuple(ext.extract(
@@ -110,16 +129,31 @@ class NPO(BatchPolopt):
         all_input_values += tuple(state_info_list) + tuple(dist_info_list)
         if self.policy.recurrent:
             all_input_values += (samples_data["valids"],)
-        loss_before = self.optimizer.loss(all_input_values)
-        mean_kl_before = self.optimizer.constraint_val(all_input_values)
-        self.optimizer.optimize(all_input_values)
-        mean_kl = self.optimizer.constraint_val(all_input_values)
-        loss_after = self.optimizer.loss(all_input_values)
+        if hasattr(self.optimizer, "loss_constraint_grad"):
+            # the optimizer evaluates loss and KL before and after the update in the passes it makes anyway
+            opt_stats = self.optimizer.optimize(all_input_values)
+            loss_before, mean_kl_before = opt_stats["loss_before"], opt_stats["constraint_val_before"]
+            loss_after, mean_kl = opt_stats["loss_after"], opt_stats["constraint_val_after"]
+            logger.record_tabular('BacktrackIters', opt_stats["n_backtracks"])
+            logger.record_tabular('CGResidual', opt_stats["cg_residual"])
+            logger.record_tabular('HvpCount', opt_stats["n_hvps"])
+            if "line_search_time_saved" in opt_stats:
+                logger.record_tabular('LineSearchEvals', opt_stats["n_line_search_evals"])
+                logger.record_tabular('LineSearchTimeSaved', opt_stats["line_search_time_saved"])
+        else:
+            loss_before = self.optimizer.loss(all_input_values)
+            mean_kl_before = self.optimizer.constraint_val(all_input_values)
+            self.optimizer.optimize(all_input_values)
+            mean_kl = self.optimizer.constraint_val(all_input_values)
+            loss_after = self.optimizer.loss(all_input_values)
         logger.record_tabular('LossBefore', loss_before)
         logger.record_tabular('LossAfter', loss_after)
         logger.record_tabular('MeanKLBefore', mean_kl_before)
         logger.record_tabular('MeanKL', mean_kl)
         logger.record_tabular('dLoss', loss_before - loss_after)
+        logger.record_tabular('CompileCacheHits', ext.compile_cache.n_hits)
+        logger.record_tabular('CompileCacheMisses', ext.compile_cache.n_misses)
+        logger.record_tabular('CompileTime', ext.compile_cache.compile_time)
         return dict()
 
     @overrides
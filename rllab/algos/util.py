@@ -165,104 +165,70 @@ class ReplayPool(Serializable):
         else:
             return state
 
-    def random_batch(self, batch_size):
+    def random_batch(self, batch_size, out=None):
         """
         Return corresponding observations, actions, rewards, terminal status,
         and next_observations for batch_size randomly chosen state transitions.
+        :param out: batch returned by a previous call with the same
+        batch_size, whose arrays are filled instead of allocating new ones. It
+        must no longer be in use.
         """
-        # Allocate the response.
-
-        observations = np.zeros(
-            (batch_size, self.concat_length) + self.observation_shape,
-            dtype=self.observation_dtype
-        )
-        actions = np.zeros(
-            (batch_size, self.action_dim),
-            dtype=self.action_dtype
-        )
-        rewards = np.zeros((batch_size,), dtype=floatX)
-        terminals = np.zeros((batch_size,), dtype='bool')
-        if self.extras is not None:
-            extras = np.zeros(
-                (batch_size,) + self.extras.shape[1:],
-                dtype=self.extras.dtype
-            )
-            next_extras = np.zeros(
-                (batch_size,) + self.extras.shape[1:],
-                dtype=self.extras.dtype
-            )
-        else:
-            extras = None
-            next_extras = None
-        next_observations = np.zeros(
-            (batch_size, self.concat_length) + self.observation_shape,
-            dtype=self.observation_dtype
-        )
-        next_actions = np.zeros(
-            (batch_size, self.action_dim),
-            dtype=self.action_dtype
-        )
-
-        count = 0
-        while count < batch_size:
-            # Randomly choose a time step from the replay memory.
-            index = self.rng.randint(
+        # Randomly choose time steps from the replay memory, all at once, and
+        # draw again for the rejected ones until there are enough.
+        # Check that each initial state corresponds entirely to a single
+        # episode, meaning none but the last frame may be terminal. If the
+        # last frame of the initial state is terminal, then the last frame of
+        # the transitioned state will actually be the first frame of a new
+        # episode, which the Q learner recognizes and handles correctly during
+        # training by zeroing the discounted future reward estimate.
+        concat_range = np.arange(self.concat_length)
+        indices = np.zeros((0,), dtype=int)
+        while len(indices) < batch_size:
+            candidates = self.rng.randint(
                 self.bottom,
-                self.bottom + self.size - self.concat_length
+                self.bottom + self.size - self.concat_length,
+                size=batch_size - len(indices)
             )
+            if self.concat_length > 1:
+                initial_terminals = self.terminals.take(
+                    candidates[:, None] + concat_range[:-1], mode='wrap')
+                candidates = candidates[~np.any(initial_terminals, axis=1)]
+            indices = np.concatenate([indices, candidates])
 
-            initial_indices = np.arange(index, index + self.concat_length)
-            transition_indices = initial_indices + 1
-            end_index = index + self.concat_length - 1
-
-            # Check that the initial state corresponds entirely to a
-            # single episode, meaning none but the last frame may be
-            # terminal. If the last frame of the initial state is
-            # terminal, then the last frame of the transitioned state
-            # will actually be the first frame of a new episode, which
-            # the Q learner recognizes and handles correctly during
-            # training by zeroing the discounted future reward estimate.
-            if np.any(self.terminals.take(initial_indices[0:-1], mode='wrap')):
-                continue
-            # do not pick samples which terminated because of horizon
-            # if np.any(self.horizon_terminals.take(initial_indices[0:-1],
-            #    mode='wrap')) or self.horizon_terminals[end_index]:
-            #    continue
-
-            # Add the state transition to the response.
-            observations[count] = self.observations.take(
-                initial_indices, axis=0, mode='wrap')
-            actions[count] = self.actions.take(end_index, mode='wrap')
-            rewards[count] = self.rewards.take(end_index, mode='wrap')
-            terminals[count] = self.terminals.take(end_index, mode='wrap')
-            if self.extras is not None:
-                extras[count] = self.extras.take(
-                    end_index, axis=0, mode='wrap')
-                next_extras[count] = self.extras.take(
-                    transition_indices, axis=0, mode='wrap')
-            next_observations[count] = self.observations.take(
-                transition_indices, axis=0, mode='wrap')
-            next_actions[count] = self.actions.take(
-                transition_indices, axis=0, mode='wrap')
-
-            count += 1
-
-        if not self.concat_observations:
-            # If we're not concatenating observations, we should squeeze the
-            # second dimension in observations and next_observations
-            observations = np.squeeze(observations, axis=1)
-            next_observations = np.squeeze(next_observations, axis=1)
-
-        return dict(
-            observations=observations,
-            actions=actions,
-            rewards=rewards,
-            next_observations=next_observations,
-            next_actions=next_actions,
-            terminals=terminals,
-            extras=extras,
-            next_extras=next_extras,
+        if self.concat_observations:
+            initial_indices = indices[:, None] + concat_range
+        else:
+            # If we're not concatenating observations, concat_length is 1 and
+            # the observations have no second dimension
+            initial_indices = indices
+        transition_indices = initial_indices + 1
+        end_indices = indices + self.concat_length - 1
+
+        def take(array, take_indices, key):
+            return array.take(take_indices, axis=0, mode='wrap',
+                              out=None if out is None else out[key])
+
+        # Add the state transitions to the response.
+        batch = dict(
+            observations=take(self.observations, initial_indices,
+                              "observations"),
+            actions=take(self.actions, end_indices, "actions"),
+            rewards=take(self.rewards, end_indices, "rewards"),
+            next_observations=take(self.observations, transition_indices,
+                                   "next_observations"),
+            next_actions=take(self.actions, end_indices + 1, "next_actions"),
+            terminals=take(self.terminals, end_indices, "terminals"),
+            extras=None,
+            next_extras=None,
         )
+        if self.extras is not None:
+            batch["extras"] = take(self.extras, end_indices, "extras")
+            batch["next_extras"] = take(self.extras, end_indices + 1,
+                                        "next_extras")
+        if out is not None:
+            # the arrays of out were filled in place
+            return out
+        return batch
 
 
 # TESTING CODE BELOW THIS POINT...
@@ -22,6 +22,12 @@ class Baseline(object):
     def predict(self, path):
         raise NotImplementedError
 
+    def predict_n(self, paths):
+        """
+        Predict the baselines of all the paths of a batch, as a list with one array per path
+        """
+        return [self.predict(path) for path in paths]
+
     @classmethod
     @autoargs.add_args
     def add_args(cls, parser):
@@ -43,6 +43,13 @@ class GaussianConvBaseline(Baseline, Parameterized, Serializable):
     def predict(self, path):
         return self._regressor.predict(path["observations"]).flatten()
 
+    @overrides
+    def predict_n(self, paths):
+        # a single forward pass over the whole batch
+        observations = np.concatenate([p["observations"] for p in paths])
+        path_lengths = [len(p["observations"]) for p in paths]
+        return np.split(self._regressor.predict(observations).flatten(), np.cumsum(path_lengths)[:-1])
+
     @overrides
     def get_param_values(self, **tags):
         return self._regressor.get_param_values(**tags)
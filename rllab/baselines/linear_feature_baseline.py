@@ -1,12 +1,16 @@
 from rllab.baselines.base import Baseline
 from rllab.misc.overrides import overrides
 import numpy as np
+import scipy.linalg
 
 
 class LinearFeatureBaseline(Baseline):
     def __init__(self, env_spec, reg_coeff=1e-5):
         self._coeffs = None
         self._reg_coeff = reg_coeff
+        # paths of the last predict_n and their feature matrix, reused by the fit that follows it
+        self._cached_paths = None
+        self._cached_featmat = None
 
     @overrides
     def get_param_values(self, **tags):
@@ -22,22 +26,65 @@ class LinearFeatureBaseline(Baseline):
         al = np.arange(l).reshape(-1, 1) / 100.0
         return np.concatenate([o, o ** 2, al, al ** 2, al ** 3, np.ones((l, 1))], axis=1)
 
+    def _features_n(self, paths):
+        """
+        Feature matrix of all the paths, built in a single pass over their concatenated observations. Calling it
+        again on the same paths returns the matrix of the previous call.
+        """
+        # baselines pickled before the cache was added have no _cached_paths
+        cached_paths = getattr(self, "_cached_paths", None)
+        if cached_paths is not None and len(cached_paths) == len(paths) and \
+                all(cached is path for cached, path in zip(cached_paths, paths)):
+            return self._cached_featmat
+        o = np.clip(np.concatenate([path["observations"] for path in paths]), -10, 10)
+        path_lengths = [len(path["rewards"]) for path in paths]
+        starts = np.cumsum(path_lengths) - path_lengths
+        al = (np.arange(len(o)) - np.repeat(starts, path_lengths)).reshape(-1, 1) / 100.0
+        featmat = np.concatenate([o, o ** 2, al, al ** 2, al ** 3, np.ones((len(o), 1))], axis=1)
+        self._cached_paths = list(paths)
+        self._cached_featmat = featmat
+        return featmat
+
     @overrides
     def fit(self, paths):
-        featmat = np.concatenate([self._features(path) for path in paths])
+        featmat = self._features_n(paths)
+        # the paths are not needed anymore once fitted
+        self._cached_paths = None
+        self._cached_featmat = None
         returns = np.concatenate([path["returns"] for path in paths])
+        gram = featmat.T.dot(featmat)
+        rhs = featmat.T.dot(returns)
         reg_coeff = self._reg_coeff
         for _ in range(5):
-            self._coeffs = np.linalg.lstsq(
-                featmat.T.dot(featmat) + reg_coeff * np.identity(featmat.shape[1]),
-                featmat.T.dot(returns)
-            )[0]
-            if not np.any(np.isnan(self._coeffs)):
-                break
+            try:
+                coeffs = scipy.linalg.cho_solve(
+                    scipy.linalg.cho_factor(gram + reg_coeff * np.identity(featmat.shape[1])),
+                    rhs
+                )
+                if not np.any(np.isnan(coeffs)):
+                    self._coeffs = coeffs
+                    break
+            except (np.linalg.LinAlgError, ValueError):
+                pass
             reg_coeff *= 10
+        else:
+            # the regularized gram matrix never factorized, solve it by least squares as before
+            reg_coeff = self._reg_coeff
+            for _ in range(5):
+                self._coeffs = np.linalg.lstsq(gram + reg_coeff * np.identity(featmat.shape[1]), rhs)[0]
+                if not np.any(np.isnan(self._coeffs)):
+                    break
+                reg_coeff *= 10
 
     @overrides
     def predict(self, path):
         if self._coeffs is None:
             return np.zeros(len(path["rewards"]))
         return self._features(path).dot(self._coeffs)
+
+    @overrides
+    def predict_n(self, paths):
+        if self._coeffs is None:
+            return [np.zeros(len(path["rewards"])) for path in paths]
+        path_lengths = [len(path["rewards"]) for path in paths]
+        return np.split(self._features_n(paths).dot(self._coeffs), np.cumsum(path_lengths)[:-1])
@@ -8,7 +8,7 @@ from rllab import spaces
 from rllab.envs.base import Step
 from rllab.envs.proxy_env import ProxyEnv
 from rllab.envs.mujoco.maze.maze_env_utils import construct_maze
-from rllab.envs.mujoco.maze.maze_env_utils import ray_segment_intersect, point_distance
+from rllab.envs.mujoco.maze.maze_env_utils import rays_segments_intersect, rays_first_hits
 from rllab.envs.mujoco.mujoco_env import MODEL_DIR, BIG
 from rllab.core.serializable import Serializable
 from rllab.misc.overrides import overrides
@@ -120,6 +120,7 @@ class MazeEnv(ProxyEnv, Serializable):
 
         self._goal_range = self._find_goal_range()
         self._cached_segments = None
+        self._observation_space = None
 
         inner_env = model_cls(*args, file_path=file_path, **kwargs)  # file to the robot specifications
         ProxyEnv.__init__(self, inner_env)  # here is where the robot env will be initialized
@@ -130,62 +131,25 @@ class MazeEnv(ProxyEnv, Serializable):
         robot_x, robot_y = self.wrapped_env.get_body_com("torso")[:2]
         ori = self.get_ori()
 
-        structure = self.MAZE_STRUCTURE
-        size_scaling = self.MAZE_SIZE_SCALING
-
-        segments = []
-        # compute the distance of all segments
-
-        # Get all line segments of the goal and the obstacles
-        for i in range(len(structure)):
-            for j in range(len(structure[0])):
-                if structure[i][j] == 1 or structure[i][j] == 'g':
-                    cx = j * size_scaling - self._init_torso_x
-                    cy = i * size_scaling - self._init_torso_y
-                    x1 = cx - 0.5 * size_scaling
-                    x2 = cx + 0.5 * size_scaling
-                    y1 = cy - 0.5 * size_scaling
-                    y2 = cy + 0.5 * size_scaling
-                    struct_segments = [
-                        ((x1, y1), (x2, y1)),
-                        ((x2, y1), (x2, y2)),
-                        ((x2, y2), (x1, y2)),
-                        ((x1, y2), (x1, y1)),
-                    ]
-                    for seg in struct_segments:
-                        segments.append(dict(
-                            segment=seg,
-                            type=structure[i][j],
-                        ))
+        segments_start, segments_end, segments_is_goal = self._get_segments()
 
         wall_readings = np.zeros(self._n_bins)
         goal_readings = np.zeros(self._n_bins)
 
-        for ray_idx in range(self._n_bins):
-            ray_ori = ori - self._sensor_span * 0.5 + 1.0 * (2 * ray_idx + 1) / (2 * self._n_bins) * self._sensor_span
-            ray_segments = []
-            for seg in segments:
-                p = ray_segment_intersect(ray=((robot_x, robot_y), ray_ori), segment=seg["segment"])
-                if p is not None:
-                    ray_segments.append(dict(
-                        segment=seg["segment"],
-                        type=seg["type"],
-                        ray_ori=ray_ori,
-                        distance=point_distance(p, (robot_x, robot_y)),
-                    ))
-            if len(ray_segments) > 0:
-                first_seg = sorted(ray_segments, key=lambda x: x["distance"])[0]
-                # print first_seg
-                if first_seg["type"] == 1:
-                    # Wall -> add to wall readings
-                    if first_seg["distance"] <= self._sensor_range:
-                        wall_readings[ray_idx] = (self._sensor_range - first_seg["distance"]) / self._sensor_range
-                elif first_seg["type"] == 'g':
+        ray_oris = ori - self._sensor_span * 0.5 + \
+                   1.0 * (2 * np.arange(self._n_bins) + 1) / (2 * self._n_bins) * self._sensor_span
+        xi, yi, hit = rays_segments_intersect((robot_x, robot_y), ray_oris, segments_start, segments_end)
+        for ray_idx, first_hit in enumerate(rays_first_hits((robot_x, robot_y), xi, yi, hit)):
+            if first_hit is None:
+                continue
+            seg_idx, distance = first_hit
+            if distance <= self._sensor_range:
+                if segments_is_goal[seg_idx]:
                     # Goal -> add to goal readings
-                    if first_seg["distance"] <= self._sensor_range:
-                        goal_readings[ray_idx] = (self._sensor_range - first_seg["distance"]) / self._sensor_range
+                    goal_readings[ray_idx] = (self._sensor_range - distance) / self._sensor_range
                 else:
-                    assert False
+                    # Wall -> add to wall readings
+                    wall_readings[ray_idx] = (self._sensor_range - distance) / self._sensor_range
 
         obs = np.concatenate([
             wall_readings,
@@ -193,6 +157,36 @@ class MazeEnv(ProxyEnv, Serializable):
         ])
         return obs
 
+    def _get_segments(self):
+        """
+        Line segments of the goal and the obstacles, computed once: arrays of start points, end points, and whether
+        each segment belongs to the goal.
+        """
+        if self._cached_segments is None:
+            structure = self.MAZE_STRUCTURE
+            size_scaling = self.MAZE_SIZE_SCALING
+            segments = []
+            is_goal = []
+            for i in range(len(structure)):
+                for j in range(len(structure[0])):
+                    if structure[i][j] == 1 or structure[i][j] == 'g':
+                        cx = j * size_scaling - self._init_torso_x
+                        cy = i * size_scaling - self._init_torso_y
+                        x1 = cx - 0.5 * size_scaling
+                        x2 = cx + 0.5 * size_scaling
+                        y1 = cy - 0.5 * size_scaling
+                        y2 = cy + 0.5 * size_scaling
+                        segments.extend([
+                            ((x1, y1), (x2, y1)),
+                            ((x2, y1), (x2, y2)),
+                            ((x2, y2), (x1, y2)),
+                            ((x1, y2), (x1, y1)),
+                        ])
+                        is_goal.extend([structure[i][j] == 'g'] * 4)
+            segments = np.array(segments, dtype=float).reshape((-1, 2, 2))
+            self._cached_segments = (segments[:, 0], segments[:, 1], np.array(is_goal, dtype=bool))
+        return self._cached_segments
+
     def get_current_robot_obs(self):
         return self.wrapped_env.get_current_obs()
 
@@ -223,9 +217,11 @@ class MazeEnv(ProxyEnv, Serializable):
     @property
     @overrides
     def observation_space(self):
-        shp = self.get_current_obs().shape
-        ub = BIG * np.ones(shp)
-        return spaces.Box(ub * -1, ub)
+        if self._observation_space is None:
+            shp = self.get_current_obs().shape
+            ub = BIG * np.ones(shp)
+            self._observation_space = spaces.Box(ub * -1, ub)
+        return self._observation_space
 
     # space of only the robot observations (they go first in the get current obs) THIS COULD GO IN PROXYENV
     @property
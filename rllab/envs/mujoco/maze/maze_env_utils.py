@@ -96,6 +96,59 @@ def point_distance(p1, p2):
     return ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
 
 
+def rays_segments_intersect(origin, ray_oris, segments_start, segments_end):
+    """
+    Vectorized ray_segment_intersect of all the rays originated from origin = (x, y) with directions ray_oris against
+    all the segments segments_start[k] -- segments_end[k]. The floating point operations are the same as the ones of
+    line_intersect, so the intersection points are identical.
+    :return: xi, yi, hit: arrays of shape (n_rays, n_segments), where hit marks the actual intersections
+    """
+    x1, y1 = origin
+    # the end of the rays are computed with math, like in ray_segment_intersect
+    x2 = np.array([x1 + math.cos(theta) for theta in ray_oris])[:, None]
+    y2 = np.array([y1 + math.sin(theta) for theta in ray_oris])[:, None]
+    dx1 = x2 - x1
+    dy1 = y2 - y1
+
+    x = segments_start[:, 0][None, :]
+    y = segments_start[:, 1][None, :]
+    dx = segments_end[:, 0][None, :] - x
+    dy = segments_end[:, 1][None, :] - y
+
+    DET = (-dx1 * dy + dy1 * dx)
+    valid = np.abs(DET) >= 0.00000001
+    with np.errstate(divide='ignore', invalid='ignore'):
+        DETinv = 1.0 / DET
+        r = DETinv * (-dy * (x - x1) + dx * (y - y1))
+        s = DETinv * (-dy1 * (x - x1) + dx1 * (y - y1))
+        xi = (x1 + r * dx1 + x + s * dx) / 2.0
+        yi = (y1 + r * dy1 + y + s * dy) / 2.0
+        hit = valid & (r >= 0) & (0 <= s) & (s <= 1)
+    return xi, yi, hit
+
+
+def rays_first_hits(origin, xi, yi, hit):
+    """
+    For each ray, find the closest intersected segment, as sorting the point_distance of the intersections would.
+    :return: list with, for each ray, None or the pair (segment index, point_distance to the intersection)
+    """
+    x1, y1 = origin
+    sq_dists = np.where(hit, (xi - x1) * (xi - x1) + (yi - y1) * (yi - y1), np.inf)
+    min_sq_dists = np.min(sq_dists, axis=1)
+    first_hits = []
+    for ray_idx, min_sq_dist in enumerate(min_sq_dists):
+        if np.isinf(min_sq_dist):
+            first_hits.append(None)
+            continue
+        # the vectorized squared distances can differ in the last bits from point_distance: break the (near) ties
+        # with the exact point_distance, keeping the first segment like the stable sort did
+        candidates = np.nonzero(sq_dists[ray_idx] <= min_sq_dist * (1 + 1e-9))[0]
+        distances = [point_distance((xi[ray_idx, k], yi[ray_idx, k]), (x1, y1)) for k in candidates]
+        best = int(np.argmin(distances))
+        first_hits.append((candidates[best], distances[best]))
+    return first_hits
+
+
 def construct_maze(maze_id=0, length=1):
     # define the maze to use
     if maze_id == 0:
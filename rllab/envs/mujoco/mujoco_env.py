@@ -93,23 +93,30 @@ class MujocoEnv(Env):
             self.init_qpos = init_qpos
         self.dcom = None
         self.current_com = None
+        # the spaces only depend on the model, so they are built once on first access
+        self._observation_space = None
+        self._action_space = None
         self.reset()
         super(MujocoEnv, self).__init__()
 
     @property
     @overrides
     def action_space(self):
-        bounds = self.model.actuator_ctrlrange
-        lb = bounds[:, 0]
-        ub = bounds[:, 1]
-        return spaces.Box(lb, ub)
+        if self._action_space is None:
+            bounds = self.model.actuator_ctrlrange
+            lb = bounds[:, 0]
+            ub = bounds[:, 1]
+            self._action_space = spaces.Box(lb, ub)
+        return self._action_space
 
     @property
     @overrides
     def observation_space(self):
-        shp = self.get_current_obs().shape
-        ub = BIG * np.ones(shp)
-        return spaces.Box(ub * -1, ub)
+        if self._observation_space is None:
+            shp = self.get_current_obs().shape
+            ub = BIG * np.ones(shp)
+            self._observation_space = spaces.Box(ub * -1, ub)
+        return self._observation_space
 
     @property
     def action_bounds(self):
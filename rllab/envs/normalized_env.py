@@ -31,6 +31,7 @@ class NormalizedEnv(ProxyEnv, Serializable):
         self._reward_mean = 0.
         self._reward_var = 1.
         self._clip = clip
+        self._action_space = None
 
     def _update_obs_estimate(self, obs):
         flat_obs = self.wrapped_env.observation_space.flatten(obs)
@@ -71,10 +72,13 @@ class NormalizedEnv(ProxyEnv, Serializable):
     @property
     @overrides
     def action_space(self):
-        if isinstance(self._wrapped_env.action_space, Box):
-            ub = np.ones(self._wrapped_env.action_space.shape)
-            return spaces.Box(-1 * ub, ub)
-        return self._wrapped_env.action_space
+        if self._action_space is None:
+            if isinstance(self._wrapped_env.action_space, Box):
+                ub = np.ones(self._wrapped_env.action_space.shape)
+                self._action_space = spaces.Box(-1 * ub, ub)
+            else:
+                self._action_space = self._wrapped_env.action_space
+        return self._action_space
 
     @overrides
     def step(self, action):
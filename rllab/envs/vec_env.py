@@ -0,0 +1,51 @@
+import cloudpickle as pickle
+import numpy as np
+
+
+class VecEnv(object):
+    """
+    Holds n_envs copies of an environment so that they can be stepped in lock-step, letting the policy choose the
+    actions of all the running copies with a single call to get_actions.
+    """
+
+    def __init__(self, env, n_envs):
+        """
+        :param env: environment to replicate. It is used as the first copy, the others are unpickled from it.
+        :param n_envs: number of environment copies
+        """
+        self.envs = [env] + [pickle.loads(pickle.dumps(env)) for _ in range(n_envs - 1)]
+        self.n_envs = n_envs
+
+    @property
+    def observation_space(self):
+        return self.envs[0].observation_space
+
+    @property
+    def action_space(self):
+        return self.envs[0].action_space
+
+    def reset(self, env_ids=None):
+        """
+        Reset the given environment copies (all of them by default) and return their initial observations.
+        """
+        if env_ids is None:
+            env_ids = range(self.n_envs)
+        return [self.envs[i].reset() for i in env_ids]
+
+    def step(self, action_n, env_ids=None):
+        """
+        Step the given environment copies (all of them by default), the i-th one with the i-th action.
+        :return: the lists of observations, the array of rewards, the array of dones and the list of env_infos
+        """
+        if env_ids is None:
+            env_ids = range(self.n_envs)
+        results = [self.envs[i].step(action) for i, action in zip(env_ids, action_n)]
+        obs, rewards, dones, env_infos = map(list, zip(*results))
+        return obs, np.asarray(rewards), np.asarray(dones), env_infos
+
+    def terminate(self):
+        """
+        Clean up the copies made by this VecEnv (the original environment is left to its owner).
+        """
+        for env in self.envs[1:]:
+            env.terminate()
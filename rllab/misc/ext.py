@@ -9,6 +9,8 @@ import numpy as np
 import operator
 from functools import reduce
 import random
+import time
+import weakref
 
 sys.setrecursionlimit(50000)
 
@@ -92,6 +94,38 @@ class lazydict(object):
         self._lazy_dict[key] = value
 
 
+class CompileCache(object):
+    """
+    Cache for the gradients and compiled functions built over a parameterized target, for optimizers that are
+    re-instantiated many times over the same policy (e.g. a new TRPO at each curriculum outer iteration). Entries are
+    kept per target and dropped with it, as long as the cached values do not reference the target: closures that
+    need it must hold a weakref. It also accumulates the time spent in compile_function.
+    """
+
+    def __init__(self):
+        self._entries = weakref.WeakKeyDictionary()
+        self.n_hits = 0
+        self.n_misses = 0
+        self.compile_time = 0.
+
+    def get(self, target, key, build):
+        """
+        :param target: the parameterized object whose parameters appear in the cached graphs
+        :param key: hashable description of everything else the cached value depends on
+        :param build: function called without arguments to build the value on a miss
+        """
+        entries = self._entries.setdefault(target, dict())
+        if key in entries:
+            self.n_hits += 1
+        else:
+            self.n_misses += 1
+            entries[key] = build()
+        return entries[key]
+
+
+compile_cache = CompileCache()
+
+
 def iscanl(f, l, base=None):
     started = False
     for x in l:
@@ -133,6 +167,7 @@ def compile_function(inputs=None, outputs=None, updates=None, givens=None, log_n
     if log_name:
         msg = Message("Compiling function %s" % log_name)
         msg.__enter__()
+    start = time.time()
     ret = theano.function(
         inputs=inputs,
         outputs=outputs,
@@ -142,6 +177,7 @@ def compile_function(inputs=None, outputs=None, updates=None, givens=None, log_n
         allow_input_downcast=True,
         **kwargs
     )
+    compile_cache.compile_time += time.time() - start
     if log_name:
         msg.__exit__(None, None, None)
     return ret
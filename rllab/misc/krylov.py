@@ -4,9 +4,11 @@ from rllab.misc.ext import sliced_fun
 EPS = np.finfo('float64').tiny
 
 
-def cg(f_Ax, b, cg_iters=10, callback=None, verbose=False, residual_tol=1e-10):
+def cg(f_Ax, b, cg_iters=10, callback=None, verbose=False, residual_tol=1e-10, return_info=False):
     """
     Demmel p 312
+    :param return_info: also return a dict with the number of iterations (n_iters, one call to f_Ax each) and the
+    squared norm of the final residual (residual)
     """
     p = b.copy()
     r = b.copy()
@@ -36,12 +38,20 @@ def cg(f_Ax, b, cg_iters=10, callback=None, verbose=False, residual_tol=1e-10):
     if callback is not None:
         callback(x)
     if verbose: print(fmtstr % (i + 1, rdotr, np.linalg.norm(x)))  # pylint: disable=W0631
+    if return_info:
+        return x, dict(n_iters=i + 1, residual=rdotr)  # pylint: disable=W0631
     return x
 
 
-def preconditioned_cg(f_Ax, f_Minvx, b, cg_iters=10, callback=None, verbose=False, residual_tol=1e-10):
+def preconditioned_cg(f_Ax, f_Minvx, b, cg_iters=10, callback=None, verbose=False, residual_tol=1e-10,
+                      return_info=False, stop_on_residual=False):
     """
     Demmel p 318
+    Stops early when the preconditioned residual r^T M^-1 r is below residual_tol.
+    :param stop_on_residual: stop when the squared norm of the (unpreconditioned) residual is below residual_tol
+    instead, as cg does
+    :param return_info: also return a dict with the number of iterations (n_iters, one call to f_Ax each) and the
+    squared norm of the final (unpreconditioned) residual (residual)
     """
     x = np.zeros_like(b)
     r = b.copy()
@@ -68,11 +78,14 @@ def preconditioned_cg(f_Ax, f_Minvx, b, cg_iters=10, callback=None, verbose=Fals
 
         ydotr = newydotr
 
-        if ydotr < residual_tol:
+        rdotr = r.dot(r)
+        if (rdotr if stop_on_residual else ydotr) < residual_tol:
             break
 
     if verbose: print(fmtstr % (cg_iters, ydotr, np.linalg.norm(x)))
 
+    if return_info:
+        return x, dict(n_iters=i + 1, residual=rdotr)  # pylint: disable=W0631
     return x
 
 
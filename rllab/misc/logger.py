@@ -3,8 +3,11 @@ from enum import Enum
 from rllab.misc.tabulate import tabulate
 from rllab.misc.console import mkdir_p, colorize
 from rllab.misc.autoargs import get_all_parameters
+from rllab.misc.tabular_log import TabularLog, tabular_log_file, export_csv
+from rllab.misc.snapshot_writer import SnapshotWriter, snapshot_state, write_file
 from contextlib import contextmanager
 import numpy as np
+import atexit
 import os
 import os.path as osp
 import sys
@@ -31,10 +34,16 @@ _text_fds = {}
 _tabular_fds = {}  # key: file_name, value: open file
 _tabular_fds_hold = {}
 _tabular_header_written = set()
+_tabular_logs = {}  # key: file_name of the csv, value: TabularLog appending its rows
+_tabular_writers = {}
+_tabular_csv_stale = set()  # csv files missing keys of their row log, exported again when the output is removed
 
 _snapshot_dir = None
 _snapshot_mode = 'all'
 _snapshot_gap = 1
+_snapshot_incremental = False
+_snapshot_writer = None
+_snapshot_bases = {}  # key: file_name of a base snapshot, value: keys of the snapshot it was written for
 
 _log_tabular_only = False
 _header_printed = False
@@ -101,12 +110,34 @@ def add_tabular_output(file_name):
         _tabular_fds[file_name] = _tabular_fds_hold[file_name]
     else:
         _add_output(file_name, _tabular_outputs, _tabular_fds, mode='w')
+        if file_name not in _tabular_logs:
+            _tabular_logs[file_name] = TabularLog(tabular_log_file(file_name))
 
 
 def remove_tabular_output(file_name):
     if file_name in _tabular_header_written:
         _tabular_header_written.remove(file_name)
-    _remove_output(file_name, _tabular_outputs, _tabular_fds)
+    if file_name in _tabular_outputs:
+        _remove_output(file_name, _tabular_outputs, _tabular_fds)
+        _close_tabular_log(file_name)
+
+
+def _close_tabular_log(file_name):
+    tabular_log = _tabular_logs.pop(file_name)
+    tabular_log.close()
+    if file_name in _tabular_csv_stale:
+        _tabular_csv_stale.remove(file_name)
+        export_csv(tabular_log.file_name, file_name)
+    _tabular_writers.pop(file_name, None)
+    _tabular_headers.pop(file_name, None)
+
+
+@atexit.register
+def _export_stale_tabular_outputs():
+    for file_name in list(_tabular_csv_stale):
+        _tabular_fds.get(file_name, _tabular_fds_hold.get(file_name)).flush()
+        _tabular_csv_stale.remove(file_name)
+        export_csv(_tabular_logs[file_name].file_name, file_name)
 
 
 def hold_tabular_output(file_name):
@@ -162,6 +193,48 @@ def set_snapshot_gap(gap):
     _snapshot_gap = gap
 
 
+def get_snapshot_incremental():
+    return _snapshot_incremental
+
+
+def set_snapshot_incremental(incremental):
+    """
+    Save the snapshots as npz files with only the parameters, env states and scalars of the snapshot objects (see
+    rllab.misc.snapshot_writer.snapshot_state), on top of a full base snapshot that is written again only when the
+    keys of the snapshots change. Use rllab.misc.snapshot_writer.load_snapshot to load them.
+    """
+    global _snapshot_incremental
+    _snapshot_incremental = incremental
+
+
+def set_snapshot_async(snapshot_async, max_pending=2):
+    """
+    Write the snapshots on a background thread, with at most max_pending snapshots waiting to be written.
+    """
+    global _snapshot_writer
+    if _snapshot_writer is not None:
+        _snapshot_writer.close()
+        _snapshot_writer = None
+    if snapshot_async:
+        _snapshot_writer = SnapshotWriter(max_pending=max_pending)
+
+
+@atexit.register
+def flush_snapshots():
+    """
+    Wait until the snapshots submitted to the background writer are written.
+    """
+    if _snapshot_writer is not None:
+        _snapshot_writer.flush()
+
+
+def _write_snapshot_file(file_name, write):
+    if _snapshot_writer is not None:
+        _snapshot_writer.submit(file_name, write)
+    else:
+        write_file(file_name, write)
+
+
 def set_log_tabular_only(log_tabular_only):
     global _log_tabular_only
     _log_tabular_only = log_tabular_only
@@ -269,43 +342,24 @@ def dump_tabular(*args, **kwargs):
                     log(line, *args, **kwargs)
             if not _tabular_disabled:
                 tabular_dict = dict(_tabular)
-                # Also write to the csv files
-                # This assumes that the keys in each iteration won't change!
+                # Rows are appended to the row log of each output, which takes new keys without rewriting anything.
+                # The csv keeps the header of its first row, padded with NaNs; when keys are added afterwards it is
+                # exported again from the row log once the output is removed (or at exit). Readers that need the new
+                # keys during the run, like viskit, parse the row log.
                 for tabular_file_name, tabular_fd in list(_tabular_fds.items()):
-                    keys = tabular_dict.keys()
-                    if tabular_file_name in _tabular_headers:
-                        # check against existing keys: if new keys re-write Header and pad with NaNs
-                        existing_keys = _tabular_headers[tabular_file_name]
-                        if not set(existing_keys).issuperset(set(keys)):
-                            joint_keys = set(keys).union(set(existing_keys))
-                            tabular_fd.flush()
-                            read_fd = open(tabular_file_name, 'r')
-                            reader = csv.DictReader(read_fd)
-                            rows = list(reader)
-                            read_fd.close()
-                            tabular_fd.close()
-                            tabular_fd = _tabular_fds[tabular_file_name] = open(tabular_file_name, 'w')
-                            new_writer = csv.DictWriter(tabular_fd, fieldnames=list(joint_keys))
-                            new_writer.writeheader()
-                            for row in rows:
-                                for key in joint_keys:
-                                    if key not in row:
-                                        row[key] = np.nan
-                            new_writer.writerows(rows)
-                            _tabular_headers[tabular_file_name] = list(joint_keys)
-                    else:
-                        _tabular_headers[tabular_file_name] = keys
-
-                    writer = csv.DictWriter(tabular_fd, fieldnames=_tabular_headers[tabular_file_name])  # list(
+                    new_keys = _tabular_logs[tabular_file_name].write(tabular_dict)
+                    if wh or tabular_file_name not in _tabular_writers:
+                        _tabular_headers[tabular_file_name] = list(_tabular_logs[tabular_file_name].keys)
+                        _tabular_writers[tabular_file_name] = csv.DictWriter(
+                            tabular_fd, fieldnames=_tabular_headers[tabular_file_name], restval=np.nan,
+                            extrasaction='ignore'
+                        )
+                    elif new_keys:
+                        _tabular_csv_stale.add(tabular_file_name)
                     if wh or (wh is None and tabular_file_name not in _tabular_header_written):
-                        writer.writeheader()
+                        _tabular_writers[tabular_file_name].writeheader()
                         _tabular_header_written.add(tabular_file_name)
-                        _tabular_headers[tabular_file_name] = keys
-                    # add NaNs in all empty fields from the header
-                    for key in _tabular_headers[tabular_file_name]:
-                        if key not in tabular_dict:
-                            tabular_dict[key] = np.nan
-                    writer.writerow(tabular_dict)
+                    _tabular_writers[tabular_file_name].writerow(tabular_dict)
                     tabular_fd.flush()
             del _tabular[:]
 
@@ -332,12 +386,26 @@ def save_itr_params(itr, params, use_cloudpickle=True, pkl_prefix=''):
             return
         else:
             raise NotImplementedError
-        if use_cloudpickle:
-            import cloudpickle
-            with open(file_name, 'wb') as f:
-                cloudpickle.dump(params, f, protocol=3)
+        if _snapshot_incremental:
+            base_file_name = osp.join(get_snapshot_dir(), pkl_prefix + 'snapshot_base.pkl')
+            if _snapshot_bases.get(base_file_name) != set(params.keys()):
+                _snapshot_bases[base_file_name] = set(params.keys())
+                _save_params(base_file_name, params, use_cloudpickle)
+            state = snapshot_state(params)
+            state["base"] = np.array(osp.basename(base_file_name))
+            _write_snapshot_file(osp.splitext(file_name)[0] + '.npz', lambda f: np.savez(f, **state))
         else:
-            joblib.dump(params, file_name, compress=3)
+            _save_params(file_name, params, use_cloudpickle)
+
+
+def _save_params(file_name, params, use_cloudpickle):
+    if use_cloudpickle:
+        import cloudpickle
+        # serialized right away, the objects may change while the background writer works
+        data = cloudpickle.dumps(params, protocol=3)
+        _write_snapshot_file(file_name, lambda f: f.write(data))
+    else:
+        joblib.dump(params, file_name, compress=3)
 
 
 def log_parameters(log_file, args, classes):
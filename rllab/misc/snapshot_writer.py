@@ -0,0 +1,169 @@
+"""
+Snapshot writing off the training thread, and incremental snapshots. An incremental snapshot is a small npz file
+with the parameter vectors, the env states and the scalars of the snapshot objects, on top of a base pickle of the
+whole snapshot that is only written again when its keys change. Use load_snapshot to read any kind of snapshot.
+"""
+import numbers
+import os
+import os.path as osp
+import queue
+import sys
+import threading
+import traceback
+
+import cloudpickle
+import joblib
+import numpy as np
+
+
+def _has_params(obj):
+    return not isinstance(obj, type) and hasattr(obj, "get_param_values") and hasattr(obj, "set_param_values")
+
+
+def _is_env(obj):
+    # imported here, rllab.envs imports theano and the logger imports this module
+    from rllab.core.serializable import Serializable
+    from rllab.envs.base import Env
+    return isinstance(obj, Env) and isinstance(obj, Serializable)
+
+
+def _is_scalar(obj):
+    return isinstance(obj, (numbers.Number, np.number))
+
+
+def _is_numeric_array(obj):
+    return isinstance(obj, np.ndarray) and obj.dtype != object
+
+
+def _object_state(name, obj, state, seen):
+    """
+    Add the state of the object obj, found at name in the snapshot, unless it is not an object with state or it was
+    already added under another name. Envs change in more than their parameters (e.g. the state generators of the
+    curriculum envs, the running statistics of a NormalizedEnv), so their whole pickled state is added: it is small
+    since a Serializable only pickles its constructor arguments.
+    """
+    if id(obj) in seen:
+        return
+    if _is_env(obj):
+        seen.add(id(obj))
+        state["env/%s" % name] = np.frombuffer(cloudpickle.dumps(obj.__getstate__(), protocol=3), dtype=np.uint8)
+    elif _has_params(obj):
+        seen.add(id(obj))
+        param_values = obj.get_param_values()
+        if param_values is not None:
+            param_values = np.asarray(param_values)
+            if param_values.dtype != object:
+                state["param/%s" % name] = param_values
+
+
+def snapshot_state(params):
+    """
+    What changes from one iteration to the next in a snapshot dict: the parameters of its values and of their
+    attributes (e.g. algo.policy, algo.baseline), the state of the envs among them, and their scalars and arrays
+    (e.g. itr, algo.current_itr). Everything else is taken from the base snapshot when loading.
+    """
+    state = dict()
+    seen = set()
+    for key, value in params.items():
+        if _is_scalar(value) or _is_numeric_array(value):
+            state["value/%s" % key] = np.array(value)
+        elif _is_env(value) or _has_params(value):
+            _object_state(key, value, state, seen)
+    for key, value in params.items():
+        if hasattr(value, "__dict__") and not _is_env(value) and not _has_params(value):
+            for attr, attr_value in vars(value).items():
+                if _is_scalar(attr_value) or _is_numeric_array(attr_value):
+                    state["attr/%s/%s" % (key, attr)] = np.array(attr_value)
+                else:
+                    _object_state("%s/%s" % (key, attr), attr_value, state, seen)
+    return state
+
+
+def load_snapshot(file_name):
+    """
+    Load a snapshot saved by logger.save_itr_params, either a full pickle or an incremental npz snapshot, which is
+    applied to its base snapshot.
+    """
+    if not file_name.endswith(".npz"):
+        return joblib.load(file_name)
+    with np.load(file_name) as state:
+        params = joblib.load(osp.join(osp.dirname(file_name), str(state["base"])))
+        for key in state.files:
+            kind, _, name = key.partition("/")
+            if kind == "value":
+                value = state[key]
+                params[name] = value.item() if value.ndim == 0 else value
+            elif kind == "param":
+                _lookup(params, name).set_param_values(state[key])
+            elif kind == "env":
+                # set in place, so that the other references to the env in the snapshot see it too
+                _lookup(params, name).__setstate__(cloudpickle.loads(state[key].tobytes()))
+            elif kind == "attr":
+                obj_key, attr = name.split("/")
+                value = state[key]
+                setattr(params[obj_key], attr, value.item() if value.ndim == 0 else value)
+    return params
+
+
+def _lookup(params, name):
+    obj = params
+    for k in name.split("/"):
+        obj = obj[k] if isinstance(obj, dict) else getattr(obj, k)
+    return obj
+
+
+def write_file(file_name, write):
+    """
+    Write a file through the function write, which takes the open file. The file is written under a temporary name
+    and then renamed, so that readers never see a partial snapshot.
+    """
+    tmp_file_name = file_name + ".tmp"
+    with open(tmp_file_name, "wb") as f:
+        write(f)
+    os.replace(tmp_file_name, file_name)
+
+
+class SnapshotWriter(object):
+    """
+    Thread writing the snapshot files. Snapshots must already be serialized (or copied) when they are submitted, so
+    that training can go on while they are written. At most max_pending snapshots wait in the queue: beyond that,
+    submit blocks until the thread catches up.
+    """
+
+    def __init__(self, max_pending=2):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                file_name, write = job
+                write_file(file_name, write)
+            except Exception:
+                self._error = "".join(traceback.format_exception(*sys.exc_info()))
+            finally:
+                self._queue.task_done()
+
+    def _check_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise IOError("Failed to write snapshot:\n" + error)
+
+    def submit(self, file_name, write):
+        self._check_error()
+        self._queue.put((file_name, write))
+
+    def flush(self):
+        self._queue.join()
+        self._check_error()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._check_error()
@@ -112,6 +112,36 @@ def discount_cumsum(x, discount):
     return scipy.signal.lfilter([1], [1, float(-discount)], x[::-1], axis=0)[::-1]
 
 
+def reverse_scan_groups(path_lengths):
+    """
+    Group the indices of a concatenation of paths by their number of steps to the end of their path: element s of
+    the returned list holds the indices of the samples that are s steps before the end of their path. Paths of
+    length 0 have no samples, so they do not appear in any group.
+    """
+    path_lengths = np.asarray(path_lengths, dtype=int)
+    ends = np.cumsum(path_lengths)
+    n_samples = ends[-1] if len(ends) > 0 else 0
+    steps_to_end = np.repeat(ends, path_lengths) - 1 - np.arange(n_samples)
+    order = np.argsort(steps_to_end, kind='mergesort')
+    return np.split(order, np.cumsum(np.bincount(steps_to_end))[:-1])
+
+
+def segmented_discount_cumsum(x, discount, groups):
+    """
+    discount_cumsum of each path of a concatenation of paths, computed as a reverse scan over the steps to the end
+    of the paths, each step vectorized over all the paths. It gives the same values as discount_cumsum on each path.
+    :param groups: indices of the samples grouped by steps to the end of their path, as given by reverse_scan_groups
+    """
+    y = np.empty(np.shape(x), dtype=np.result_type(x, np.float64))
+    discount = float(discount)
+    for steps_to_end, idx in enumerate(groups):
+        if steps_to_end == 0:
+            y[idx] = x[idx]
+        else:
+            y[idx] = x[idx] + discount * y[idx + 1]
+    return y
+
+
 def discount_return(x, discount):
     return np.sum(x * (discount ** np.arange(len(x))))
 
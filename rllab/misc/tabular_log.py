@@ -0,0 +1,76 @@
+"""
+Append-only log of the tabular rows, which the logger keeps next to each tabular csv output. Every line is a json
+document: either the list of keys, written again whenever new keys show up, or a row with the values of the current
+keys. New keys never require rewriting the earlier rows, and readers can parse the file incrementally from any line
+boundary.
+"""
+import csv
+import json
+import os.path as osp
+
+
+def tabular_log_file(csv_file):
+    """
+    Name of the row log kept for the tabular output csv_file, e.g. progress.jsonl for progress.csv.
+    """
+    return osp.splitext(csv_file)[0] + '.jsonl'
+
+
+class TabularLog(object):
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.keys = []
+        self._key_set = set()
+        self._fd = open(file_name, 'w')
+
+    def write(self, tabular_dict):
+        """
+        Append a row. Return whether it added keys to the log.
+        """
+        new_keys = [key for key in tabular_dict.keys() if key not in self._key_set]
+        if new_keys:
+            self.keys.extend(new_keys)
+            self._key_set.update(new_keys)
+            self._fd.write(json.dumps(dict(keys=self.keys)) + '\n')
+        self._fd.write(json.dumps([tabular_dict.get(key) for key in self.keys]) + '\n')
+        self._fd.flush()
+        return len(new_keys) > 0
+
+    def close(self):
+        self._fd.close()
+
+
+def read_tabular_log(file_name, offset=0, keys=None):
+    """
+    Parse the rows of a row log from the byte offset on, which must be a line boundary. keys is the list of keys in
+    effect at the offset, as returned by the previous call.
+    :return: the keys at the end of the file, the rows as dicts, and the offset to continue from. A last line that is
+    still being written is left for the next call.
+    """
+    keys = list(keys or [])
+    rows = []
+    with open(file_name, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].decode('utf-8').splitlines():
+        if not line:
+            continue
+        record = json.loads(line)
+        if isinstance(record, dict):
+            keys = record["keys"]
+        else:
+            rows.append(dict(zip(keys, record)))
+    return keys, rows, offset + end
+
+
+def export_csv(log_file, csv_file):
+    """
+    Write the whole row log as a csv file, with nan for the keys that a row does not have.
+    """
+    keys, rows, _ = read_tabular_log(log_file)
+    with open(csv_file, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=keys, restval='nan')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict((k, 'nan' if v is None else v) for k, v in row.items()))
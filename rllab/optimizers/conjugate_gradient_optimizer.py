@@ -5,9 +5,10 @@ from rllab.core.serializable import Serializable
 import theano.tensor as TT
 import theano
 import itertools
+import time
+import weakref
 import numpy as np
 from rllab.misc.ext import sliced_fun
-from _ast import Num
 
 
 class PerlmutterHvp(Serializable):
@@ -73,29 +74,33 @@ class FiniteDifferenceHvp(Serializable):
         constraint_grads = theano.grad(
             f, wrt=params, disconnected_inputs='warn')
         flat_grad = ext.flatten_tensor_variables(constraint_grads)
+        # f_Hx_plain only references the target weakly, so that ext.compile_cache can drop it with the target
+        target_ref = weakref.ref(target)
+        eps = self.base_eps
+        symmetric = self.symmetric
 
         def f_Hx_plain(*args):
+            target = target_ref()
             inputs_ = args[:len(inputs)]
             xs = args[len(inputs):]
             flat_xs = np.concatenate([np.reshape(x, (-1,)) for x in xs])
-            param_val = self.target.get_param_values(trainable=True)
-            eps = self.base_eps
-            self.target.set_param_values(
+            param_val = target.get_param_values(trainable=True)
+            target.set_param_values(
                 param_val + eps * flat_xs, trainable=True)
-            flat_grad_dvplus = self.opt_fun["f_grad"](*inputs_)
-            if self.symmetric:
-                self.target.set_param_values(
+            flat_grad_dvplus = opt_fun["f_grad"](*inputs_)
+            if symmetric:
+                target.set_param_values(
                     param_val - eps * flat_xs, trainable=True)
-                flat_grad_dvminus = self.opt_fun["f_grad"](*inputs_)
+                flat_grad_dvminus = opt_fun["f_grad"](*inputs_)
                 hx = (flat_grad_dvplus - flat_grad_dvminus) / (2 * eps)
-                self.target.set_param_values(param_val, trainable=True)
+                target.set_param_values(param_val, trainable=True)
             else:
-                self.target.set_param_values(param_val, trainable=True)
-                flat_grad = self.opt_fun["f_grad"](*inputs_)
+                target.set_param_values(param_val, trainable=True)
+                flat_grad = opt_fun["f_grad"](*inputs_)
                 hx = (flat_grad_dvplus - flat_grad) / eps
             return hx
 
-        self.opt_fun = ext.lazydict(
+        opt_fun = self.opt_fun = ext.lazydict(
             f_grad=lambda: ext.compile_function(
                 inputs=inputs,
                 outputs=flat_grad,
@@ -130,7 +135,13 @@ class ConjugateGradientOptimizer(Serializable):
             max_backtracks=15,
             accept_violation=False,
             hvp_approach=None,
-            num_slices=1):
+            num_slices=1,
+            speculative_line_search=False,
+            line_search_subsample_factor=0.1,
+            cg_residual_tol=1e-10,
+            precondition=False,
+            precondition_n_chunks=16,
+            precondition_damping=1e-2):
         """
 
         :param cg_iters: The number of CG iterations used to calculate A^-1 g
@@ -139,6 +150,15 @@ class ConjugateGradientOptimizer(Serializable):
         computation time for the descent direction dominates, this can greatly reduce the overall computation time.
         :param accept_violation: whether to accept the descent step if it violates the line search condition after
         exhausting all backtracking budgets
+        :param speculative_line_search: whether to run the backtracking line search on a subsample of the inputs
+        first, and start the full-batch line search from the first step ratio accepted on the subsample
+        :param line_search_subsample_factor: Subsampling factor of the inputs for the speculative line search
+        :param cg_residual_tol: CG stops early when the squared norm of its residual is below this value
+        :param precondition: whether to precondition CG with a diagonal estimate of the Fisher information, which
+        requires update_opt to receive the log-likelihood of the inputs (precondition_loglik)
+        :param precondition_n_chunks: number of chunks of the inputs whose log-likelihood gradients are used to
+        estimate the diagonal of the Fisher information
+        :param precondition_damping: added to the diagonal estimate, relative to its mean
         :return:
         """
         Serializable.quick_init(self, locals())
@@ -148,6 +168,12 @@ class ConjugateGradientOptimizer(Serializable):
         self._backtrack_ratio = backtrack_ratio
         self._max_backtracks = max_backtracks
         self._num_slices = num_slices
+        self._speculative_line_search = speculative_line_search
+        self._line_search_subsample_factor = line_search_subsample_factor
+        self._cg_residual_tol = cg_residual_tol
+        self._precondition = precondition
+        self._precondition_n_chunks = precondition_n_chunks
+        self._precondition_damping = precondition_damping
 
         self._opt_fun = None
         self._target = None
@@ -158,8 +184,8 @@ class ConjugateGradientOptimizer(Serializable):
             hvp_approach = PerlmutterHvp(num_slices)
         self._hvp_approach = hvp_approach
 
-    def update_opt(self, loss, target, leq_constraint, inputs, extra_inputs=None, constraint_name="constraint", *args,
-                   **kwargs):
+    def update_opt(self, loss, target, leq_constraint, inputs, extra_inputs=None, constraint_name="constraint",
+                   cache_key=None, precondition_loglik=None, *args, **kwargs):
         """
         :param loss: Symbolic expression for the loss function.
         :param target: A parameterized object to optimize over. It should implement methods of the
@@ -168,8 +194,15 @@ class ConjugateGradientOptimizer(Serializable):
         :param inputs: A list of symbolic variables as inputs, which could be subsampled if needed. It is assumed
         that the first dimension of these inputs should correspond to the number of data points
         :param extra_inputs: A list of symbolic variables as extra inputs which should not be subsampled
+        :param cache_key: Hashable description of how loss, constraint and inputs are built from the target. Later
+        calls with the same target, hvp approach and cache_key reuse the gradients and compiled functions of the first
+        one through ext.compile_cache, instead of building them again.
+        :param precondition_loglik: Symbolic mean log-likelihood of the sampled actions under the target, whose
+        gradients give the diagonal Fisher estimate used as preconditioner
         :return: No return value.
         """
+        assert precondition_loglik is not None or not self._precondition, \
+            "Preconditioning requires the log-likelihood of the inputs"
 
         inputs = tuple(inputs)
         if extra_inputs is None:
@@ -179,40 +212,65 @@ class ConjugateGradientOptimizer(Serializable):
 
         constraint_term, constraint_value = leq_constraint
 
-        params = target.get_params(trainable=True)
-        grads = theano.grad(loss, wrt=params, disconnected_inputs='warn')
-        flat_grad = ext.flatten_tensor_variables(grads)
-
-        self._hvp_approach.update_opt(f=constraint_term, target=target, inputs=inputs + extra_inputs,
-                                      reg_coeff=self._reg_coeff)
+        def build_opt_fun():
+            params = target.get_params(trainable=True)
+            grads = theano.grad(loss, wrt=params, disconnected_inputs='warn')
+            flat_grad = ext.flatten_tensor_variables(grads)
+
+            self._hvp_approach.update_opt(f=constraint_term, target=target, inputs=inputs + extra_inputs,
+                                          reg_coeff=self._reg_coeff)
+
+            opt_fun = ext.lazydict(
+                f_loss=lambda: ext.compile_function(
+                    inputs=inputs + extra_inputs,
+                    outputs=loss,
+                    log_name="f_loss",
+                ),
+                f_grad=lambda: ext.compile_function(
+                    inputs=inputs + extra_inputs,
+                    outputs=flat_grad,
+                    log_name="f_grad",
+                ),
+                f_constraint=lambda: ext.compile_function(
+                    inputs=inputs + extra_inputs,
+                    outputs=constraint_term,
+                    log_name="constraint",
+                ),
+                f_loss_constraint=lambda: ext.compile_function(
+                    inputs=inputs + extra_inputs,
+                    outputs=[loss, constraint_term],
+                    log_name="f_loss_constraint",
+                ),
+                f_loss_constraint_grad=lambda: ext.compile_function(
+                    inputs=inputs + extra_inputs,
+                    outputs=[loss, constraint_term, flat_grad],
+                    log_name="f_loss_constraint_grad",
+                ),
+            )
+            if precondition_loglik is not None:
+                opt_fun.set("f_loglik_grad", lambda: ext.compile_function(
+                    inputs=inputs + extra_inputs,
+                    outputs=ext.flatten_tensor_variables(
+                        theano.grad(precondition_loglik, wrt=params, disconnected_inputs='ignore')),
+                    log_name="f_loglik_grad",
+                ))
+            return opt_fun, self._hvp_approach.opt_fun
+
+        if cache_key is None:
+            self._opt_fun, _ = build_opt_fun()
+        else:
+            # entries built without the log-likelihood have no f_loglik_grad
+            key = (type(self), type(self._hvp_approach), repr(self._hvp_approach.__getstate__()), cache_key,
+                   precondition_loglik is not None)
+            self._opt_fun, hvp_opt_fun = ext.compile_cache.get(target, key, build_opt_fun)
+            self._hvp_approach.target = target
+            self._hvp_approach.reg_coeff = self._reg_coeff
+            self._hvp_approach.opt_fun = hvp_opt_fun
 
         self._target = target
         self._max_constraint_val = constraint_value
         self._constraint_name = constraint_name
 
-        self._opt_fun = ext.lazydict(
-            f_loss=lambda: ext.compile_function(
-                inputs=inputs + extra_inputs,
-                outputs=loss,
-                log_name="f_loss",
-            ),
-            f_grad=lambda: ext.compile_function(
-                inputs=inputs + extra_inputs,
-                outputs=flat_grad,
-                log_name="f_grad",
-            ),
-            f_constraint=lambda: ext.compile_function(
-                inputs=inputs + extra_inputs,
-                outputs=constraint_term,
-                log_name="constraint",
-            ),
-            f_loss_constraint=lambda: ext.compile_function(
-                inputs=inputs + extra_inputs,
-                outputs=[loss, constraint_term],
-                log_name="f_loss_constraint",
-            ),
-        )
-
     def loss(self, inputs, extra_inputs=None):
         inputs = tuple(inputs)
         if extra_inputs is None:
@@ -225,36 +283,63 @@ class ConjugateGradientOptimizer(Serializable):
             extra_inputs = tuple()
         return sliced_fun(self._opt_fun["f_constraint"], self._num_slices)(inputs, extra_inputs)
 
+    def loss_constraint(self, inputs, extra_inputs=None):
+        """
+        Loss and constraint value in a single pass over the inputs.
+        """
+        inputs = tuple(inputs)
+        if extra_inputs is None:
+            extra_inputs = tuple()
+        return sliced_fun(self._opt_fun["f_loss_constraint"], self._num_slices)(inputs, extra_inputs)
+
+    def loss_constraint_grad(self, inputs, extra_inputs=None):
+        """
+        Loss, constraint value and flat gradient of the loss in a single pass over the inputs.
+        """
+        inputs = tuple(inputs)
+        if extra_inputs is None:
+            extra_inputs = tuple()
+        return sliced_fun(self._opt_fun["f_loss_constraint_grad"], self._num_slices)(inputs, extra_inputs)
+
     def optimize(self, inputs, extra_inputs=None, subsample_grouped_inputs=None):
+        """
+        :return: a dict with the loss and constraint value before and after the update (loss_before,
+        constraint_val_before, loss_after, constraint_val_after), taken from the evaluations the update needs anyway
+        """
 
         inputs = tuple(inputs)
         if extra_inputs is None:
             extra_inputs = tuple()
 
         if self._subsample_factor < 1:
-            if subsample_grouped_inputs is None:
-                subsample_grouped_inputs = [inputs]
-            subsample_inputs = tuple()
-            for inputs_grouped in subsample_grouped_inputs:
-                n_samples = len(inputs_grouped[0])
-                inds = np.random.choice(
-                    n_samples, int(n_samples * self._subsample_factor), replace=False)
-                subsample_inputs += tuple([x[inds] for x in inputs_grouped])
+            subsample_inputs = self._subsample(inputs, subsample_grouped_inputs, self._subsample_factor)
         else:
             subsample_inputs = inputs
 
-        logger.log("computing loss before")
-        loss_before = sliced_fun(self._opt_fun["f_loss"], self._num_slices)(
-            inputs, extra_inputs)
         logger.log("performing update")
+        logger.log("computing loss, constraint and gradient before")
+
+        loss_before, constraint_val_before, flat_g = self.loss_constraint_grad(inputs, extra_inputs)
+
         logger.log("computing descent direction")
 
-        flat_g = sliced_fun(self._opt_fun["f_grad"], self._num_slices)(
-            inputs, extra_inputs)
+        hvp = self._hvp_approach.build_eval(subsample_inputs + extra_inputs)
+        n_hvps = [0]
 
-        Hx = self._hvp_approach.build_eval(subsample_inputs + extra_inputs)
+        def Hx(x):
+            n_hvps[0] += 1
+            return hvp(x)
 
-        descent_direction = krylov.cg(Hx, flat_g, cg_iters=self._cg_iters)
+        if self._precondition:
+            fisher_diag = self._fisher_diag(subsample_inputs, extra_inputs)
+            # stopping on the unpreconditioned residual, so that cg_residual_tol and the reported residual mean the
+            # same with and without preconditioning
+            descent_direction, cg_info = krylov.preconditioned_cg(
+                Hx, lambda x: x / fisher_diag, flat_g, cg_iters=self._cg_iters, residual_tol=self._cg_residual_tol,
+                stop_on_residual=True, return_info=True)
+        else:
+            descent_direction, cg_info = krylov.cg(
+                Hx, flat_g, cg_iters=self._cg_iters, residual_tol=self._cg_residual_tol, return_info=True)
 
         initial_step_size = np.sqrt(
             2.0 * self._max_constraint_val *
@@ -267,13 +352,26 @@ class ConjugateGradientOptimizer(Serializable):
         logger.log("descent direction computed")
 
         prev_param = np.copy(self._target.get_param_values(trainable=True))
-        n_iter = 0
-        for n_iter, ratio in enumerate(self._backtrack_ratio ** np.arange(self._max_backtracks)):
-            cur_step = ratio * flat_descent_step
+        ratios = self._backtrack_ratio ** np.arange(self._max_backtracks)
+        start_iter = 0
+        if self._speculative_line_search:
+            speculative_start = time.time()
+            start_iter = self._speculative_backtrack_iter(
+                prev_param, flat_descent_step, ratios, inputs, extra_inputs, subsample_grouped_inputs)
+            speculative_time = time.time() - speculative_start
+        n_iter = start_iter
+        n_evals = 0
+        evals_time = 0.
+        # without any backtracking iteration the step is rejected
+        loss, constraint_val = loss_before, constraint_val_before
+        for n_iter in range(start_iter, len(ratios)):
+            cur_step = ratios[n_iter] * flat_descent_step
             cur_param = prev_param - cur_step
             self._target.set_param_values(cur_param, trainable=True)
-            loss, constraint_val = sliced_fun(
-                self._opt_fun["f_loss_constraint"], self._num_slices)(inputs, extra_inputs)
+            eval_start = time.time()
+            loss, constraint_val = self.loss_constraint(inputs, extra_inputs)
+            evals_time += time.time() - eval_start
+            n_evals += 1
             if loss < loss_before and constraint_val <= self._max_constraint_val:
                 break
         if (np.isnan(loss) or np.isnan(constraint_val) or loss >= loss_before or constraint_val >=
@@ -290,6 +388,66 @@ class ConjugateGradientOptimizer(Serializable):
                 logger.log(
                     "Violated because constraint %s is violated" % self._constraint_name)
             self._target.set_param_values(prev_param, trainable=True)
+            loss, constraint_val = loss_before, constraint_val_before
         logger.log("backtrack iters: %d" % n_iter)
-        logger.log("computing loss after")
         logger.log("optimization finished")
+        stats = dict(
+            loss_before=loss_before,
+            constraint_val_before=constraint_val_before,
+            loss_after=loss,
+            constraint_val_after=constraint_val,
+            n_backtracks=n_iter,
+            cg_residual=cg_info["residual"],
+            n_hvps=n_hvps[0],
+        )
+        if self._speculative_line_search:
+            # the plain line search would have evaluated every ratio up to the last one on the full batch
+            stats["n_line_search_evals"] = n_evals
+            if n_evals > 0:
+                stats["line_search_time_saved"] = (n_iter + 1 - n_evals) * evals_time / n_evals - speculative_time
+            else:
+                stats["line_search_time_saved"] = -speculative_time
+        return stats
+
+    def _fisher_diag(self, inputs, extra_inputs):
+        """
+        Diagonal of the Fisher information, estimated from the gradients of the mean log-likelihood over chunks of
+        the inputs: at the parameters the actions were sampled with, the scores have zero mean, so the squared
+        gradient over a chunk times its size is an unbiased estimate of the diagonal.
+        """
+        n_samples = len(inputs[0])
+        chunks = np.array_split(np.arange(n_samples), max(1, min(self._precondition_n_chunks, n_samples)))
+        fisher_diag = 0.
+        for chunk in chunks:
+            flat_g = self._opt_fun["f_loglik_grad"](*([x[chunk] for x in inputs] + list(extra_inputs)))
+            fisher_diag += len(chunk) * np.square(flat_g)
+        fisher_diag /= len(chunks)
+        return fisher_diag + self._precondition_damping * np.mean(fisher_diag) + self._reg_coeff
+
+    def _subsample(self, inputs, subsample_grouped_inputs, subsample_factor):
+        if subsample_grouped_inputs is None:
+            subsample_grouped_inputs = [inputs]
+        subsample_inputs = tuple()
+        for inputs_grouped in subsample_grouped_inputs:
+            n_samples = len(inputs_grouped[0])
+            inds = np.random.choice(
+                n_samples, max(1, int(n_samples * subsample_factor)), replace=False)
+            subsample_inputs += tuple([x[inds] for x in inputs_grouped])
+        return subsample_inputs
+
+    def _speculative_backtrack_iter(self, prev_param, flat_descent_step, ratios, inputs, extra_inputs,
+                                    subsample_grouped_inputs):
+        """
+        Backtracking line search on a subsample of the inputs, where trying each step ratio is cheap. Returns the
+        index of the first ratio that satisfies the line search condition on the subsample, which the full-batch line
+        search then starts from, or 0 if none does.
+        """
+        subsample_inputs = self._subsample(inputs, subsample_grouped_inputs, self._line_search_subsample_factor)
+        self._target.set_param_values(prev_param, trainable=True)
+        loss_before = self.loss(subsample_inputs, extra_inputs)
+        for n_iter, ratio in enumerate(ratios):
+            self._target.set_param_values(prev_param - ratio * flat_descent_step, trainable=True)
+            loss, constraint_val = self.loss_constraint(subsample_inputs, extra_inputs)
+            if loss < loss_before and constraint_val <= self._max_constraint_val:
+                return n_iter
+        return 0
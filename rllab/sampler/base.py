@@ -46,36 +46,39 @@ class BaseSampler(Sampler):
         self.algo = algo
 
     def process_samples(self, itr, paths):
-        baselines = []
-        returns = []
+        # a path without samples would break the indexing of the segments below (e.g. reduceat at its start)
+        paths = [path for path in paths if len(path["rewards"]) > 0]
+        path_lengths = np.array([len(path["rewards"]) for path in paths])
+        starts = np.cumsum(path_lengths) - path_lengths
 
         if hasattr(self.algo.baseline, "predict_n"):
             all_path_baselines = self.algo.baseline.predict_n(paths)
         else:
             all_path_baselines = [self.algo.baseline.predict(path) for path in paths]
 
-        for idx, path in enumerate(paths):
-            path_baselines = np.append(all_path_baselines[idx], 0)
-            deltas = path["rewards"] + \
-                     self.algo.discount * path_baselines[1:] - \
-                     path_baselines[:-1]
-            path["advantages"] = special.discount_cumsum(
-                deltas, self.algo.discount * self.algo.gae_lambda)
-            path["returns"] = special.discount_cumsum(path["rewards"], self.algo.discount)
-            baselines.append(path_baselines[:-1])
-            returns.append(path["returns"])
-
-        ev = special.explained_variance_1d(
-            np.concatenate(baselines),
-            np.concatenate(returns)
-        )
+        # all the paths are processed at once in concatenated buffers, each path being a segment of them
+        rewards = tensor_utils.concat_tensor_list([path["rewards"] for path in paths])
+        baselines = tensor_utils.concat_tensor_list(all_path_baselines).astype(np.float64, copy=False)
+        next_baselines = np.empty_like(baselines)
+        next_baselines[:-1] = baselines[1:]
+        next_baselines[starts + path_lengths - 1] = 0
+        deltas = rewards + self.algo.discount * next_baselines - baselines
+        groups = special.reverse_scan_groups(path_lengths)
+        advantages = special.segmented_discount_cumsum(deltas, self.algo.discount * self.algo.gae_lambda, groups)
+        returns = special.segmented_discount_cumsum(rewards, self.algo.discount, groups)
+        for path, start, path_length in zip(paths, starts, path_lengths):
+            path["advantages"] = advantages[start:start + path_length]
+            path["returns"] = returns[start:start + path_length]
+
+        ev = special.explained_variance_1d(baselines, returns)
+
+        average_discounted_return = np.mean(returns[starts])
+
+        undiscounted_returns = np.add.reduceat(rewards, starts)
 
         if not self.algo.policy.recurrent:
             observations = tensor_utils.concat_tensor_list([path["observations"] for path in paths])
             actions = tensor_utils.concat_tensor_list([path["actions"] for path in paths])
-            rewards = tensor_utils.concat_tensor_list([path["rewards"] for path in paths])
-            returns = tensor_utils.concat_tensor_list([path["returns"] for path in paths])
-            advantages = tensor_utils.concat_tensor_list([path["advantages"] for path in paths])
             env_infos = tensor_utils.concat_tensor_dict_list([path["env_infos"] for path in paths])
             agent_infos = tensor_utils.concat_tensor_dict_list([path["agent_infos"] for path in paths])
 
@@ -85,11 +88,6 @@ class BaseSampler(Sampler):
             if self.algo.positive_adv:
                 advantages = util.shift_advantages_to_positive(advantages)
 
-            average_discounted_return = \
-                np.mean([path["returns"][0] for path in paths])
-
-            undiscounted_returns = [sum(path["rewards"]) for path in paths]
-
             ent = np.mean(self.algo.policy.distribution.entropy(agent_infos))
 
             samples_data = dict(
@@ -103,30 +101,33 @@ class BaseSampler(Sampler):
                 paths=paths,
             )
         else:
-            max_path_length = max([len(path["advantages"]) for path in paths])
+            max_path_length = np.max(path_lengths)
+            # position of each sample of the concatenated buffers in the padded arrays
+            padded_idx = (np.repeat(np.arange(len(paths)), path_lengths),
+                          np.arange(len(rewards)) - np.repeat(starts, path_lengths))
+
+            def pad_flat(x):
+                padded = np.zeros((len(paths), max_path_length) + x.shape[1:], dtype=x.dtype)
+                padded[padded_idx] = x
+                return padded
 
             # make all paths the same length (pad extra advantages with 0)
             obs = [path["observations"] for path in paths]
             obs = tensor_utils.pad_tensor_n(obs, max_path_length)
 
             if self.algo.center_adv:
-                raw_adv = np.concatenate([path["advantages"] for path in paths])
-                adv_mean = np.mean(raw_adv)
-                adv_std = np.std(raw_adv) + 1e-8
-                adv = [(path["advantages"] - adv_mean) / adv_std for path in paths]
+                adv_mean = np.mean(advantages)
+                adv_std = np.std(advantages) + 1e-8
+                adv = pad_flat((advantages - adv_mean) / adv_std)
             else:
-                adv = [path["advantages"] for path in paths]
-
-            adv = np.asarray([tensor_utils.pad_tensor(a, max_path_length) for a in adv])
+                adv = pad_flat(advantages)
 
             actions = [path["actions"] for path in paths]
             actions = tensor_utils.pad_tensor_n(actions, max_path_length)
 
-            rewards = [path["rewards"] for path in paths]
-            rewards = tensor_utils.pad_tensor_n(rewards, max_path_length)
+            rewards = pad_flat(rewards)
 
-            returns = [path["returns"] for path in paths]
-            returns = tensor_utils.pad_tensor_n(returns, max_path_length)
+            returns = pad_flat(returns)
 
             agent_infos = [path["agent_infos"] for path in paths]
             agent_infos = tensor_utils.stack_tensor_dict_list(
@@ -138,13 +139,7 @@ class BaseSampler(Sampler):
                 [tensor_utils.pad_tensor_dict(p, max_path_length) for p in env_infos]
             )
 
-            valids = [np.ones_like(path["returns"]) for path in paths]
-            valids = tensor_utils.pad_tensor_n(valids, max_path_length)
-
-            average_discounted_return = \
-                np.mean([path["returns"][0] for path in paths])
-
-            undiscounted_returns = [sum(path["rewards"]) for path in paths]
+            valids = pad_flat(np.ones_like(advantages))
 
             ent = np.sum(self.algo.policy.distribution.entropy(agent_infos) * valids) / np.sum(valids)
 
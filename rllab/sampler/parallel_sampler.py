@@ -1,5 +1,6 @@
 from rllab.sampler.utils import rollout
 from rllab.sampler.stateful_pool import singleton_pool, SharedGlobal
+from rllab.sampler.shared_memory import SharedArray, SharedPathBuffers, path_schema, shared_memory_free_bytes
 from rllab.misc import ext
 from rllab.misc import logger
 from rllab.misc import tensor_utils
@@ -18,6 +19,8 @@ def _worker_init(G, id):
 
 
 def initialize(n_parallel):
+    # the buffers were attached to the workers of the previous pool
+    _shared_params.clear()
     singleton_pool.initialize(n_parallel)
     singleton_pool.run_each(_worker_init, [(id,) for id in range(singleton_pool.n_parallel)])
 
@@ -59,6 +62,8 @@ def populate_task(env, policy, scope=None):
             # already populated; return
             return
     logger.log("Populating workers...")
+    # the paths of the new env may not match the shared path buffers anymore
+    _path_schemas.pop(scope, None)
     _cached_populate_env[scope] = env
     _cached_populate_policy[scope] = policy
     if singleton_pool.n_parallel > 1:
@@ -81,6 +86,9 @@ def terminate_task(scope=None):
     )
     del _cached_populate_env[scope]
     del _cached_populate_policy[scope]
+    for kind in ["policy", "env"]:
+        _shared_params.pop((scope, kind), None)
+    _path_schemas.pop(scope, None)
 
 
 def _worker_set_seed(_, seed):
@@ -105,9 +113,76 @@ def _worker_set_env_params(G, params, scope=None):
     G.env.set_param_values(params)
 
 
-def _worker_collect_one_path(G, max_path_length, scope=None):
+def _worker_attach_shared_params(G, kind, values, version, scope=None):
     G = _get_scoped_G(G, scope)
+    if not hasattr(G, "shared_params"):
+        G.shared_params = dict()
+        G.shared_params_versions = dict()
+    G.shared_params[kind] = (values, version)
+    G.shared_params_versions[kind] = None
+
+
+def sync_shared_params(G):
+    """
+    Called by the workers, with their scoped G, before collecting samples: set the parameters of the policy and of the
+    env that were broadcast since the last call, reading them directly from the shared buffers.
+    """
+    for kind, (values, version) in getattr(G, "shared_params", dict()).items():
+        cur_version = int(version.array[0])
+        if G.shared_params_versions[kind] != cur_version:
+            if kind == "policy":
+                G.policy.set_param_values(values.array)
+            else:
+                G.env.set_param_values(values.array)
+            G.shared_params_versions[kind] = cur_version
+
+
+_shared_params = dict()
+
+
+def _broadcast_shared_params(kind, params, scope=None):
+    params = np.asarray(params)
+    key = (scope, kind)
+    if key not in _shared_params or _shared_params[key][0].shape != params.shape \
+            or _shared_params[key][0].dtype != params.dtype:
+        # (re)allocate the buffers and attach the workers to them: this is the only time anything is pickled
+        values = SharedArray(params.shape, params.dtype)
+        version = SharedArray((1,), np.int64)
+        singleton_pool.run_each(
+            _worker_attach_shared_params,
+            [(kind, values, version, scope)] * singleton_pool.n_parallel
+        )
+        values.unlink()
+        version.unlink()
+        _shared_params[key] = (values, version)
+    values, version = _shared_params[key]
+    # no worker is collecting samples at this point, so the buffer can be overwritten in place
+    values.array[:] = params
+    version.array[0] += 1
+
+
+def broadcast_params(policy_params, env_params=None, scope=None):
+    """
+    Make the workers use the given policy (and env) parameters for the next samples they collect. With several
+    workers the parameters are written to shared memory along with a version counter, and each worker picks them up
+    in sync_shared_params before its next rollout, without any pickling or barrier round-trip.
+    """
+    if singleton_pool.n_parallel > 1:
+        _broadcast_shared_params("policy", policy_params, scope)
+        if env_params is not None:
+            _broadcast_shared_params("env", env_params, scope)
+    else:
+        _worker_set_policy_params(singleton_pool.G, policy_params, scope)
+        if env_params is not None:
+            _worker_set_env_params(singleton_pool.G, env_params, scope)
+
+
+def _worker_collect_one_path(G, max_path_length, scope=None, path_buffers=None):
+    G = _get_scoped_G(G, scope)
+    sync_shared_params(G)
     path = rollout(G.env, G.policy, max_path_length)
+    if path_buffers is not None:
+        return path_buffers.write(getattr(G, "worker_id", None), path), len(path["rewards"])
     return path, len(path["rewards"])
 
 
@@ -116,6 +191,30 @@ def _worker_collect_one_path(G, max_path_length, scope=None):
 #     path = rollout_snn(G.env, G.policy, max_path_length, switch_lat_every=switch_lat_every)
 #     return path, len(path["rewards"])
 
+_path_schemas = dict()
+
+
+def _make_path_buffers(max_samples, max_path_length, scope):
+    """
+    Shared buffers for the workers to write the paths of the next batch, if the layout of the paths is known from a
+    previous batch and there is enough shared memory for it.
+    """
+    if singleton_pool.n_parallel == 1 or scope not in _path_schemas:
+        return None
+    schema = _path_schemas[scope]
+    # a worker collects paths until the total reaches max_samples, so it can overshoot by at most one path
+    capacity = int(max_samples)
+    if max_path_length != np.inf:
+        capacity += int(max_path_length)
+    step_bytes = sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for shape, dtype in schema.values())
+    # only the written pages use memory, which is at most one batch plus one path per worker
+    needed_bytes = step_bytes * (capacity + singleton_pool.n_parallel * (capacity - int(max_samples)))
+    if needed_bytes > shared_memory_free_bytes():
+        logger.log("Not enough shared memory for the path buffers, sending the paths through the pool")
+        return None
+    return SharedPathBuffers(schema, singleton_pool.n_parallel, capacity)
+
+
 def sample_paths(
         policy_params,
         max_samples,
@@ -128,23 +227,27 @@ def sample_paths(
     might be greater since all trajectories will be rolled out either until termination or until max_path_length is
     reached
     :param max_path_length: horizon / maximum length of a single trajectory
-    :return: a list of collected paths
+    :return: a list of collected paths. With several workers, the arrays of the paths are views of shared memory
+    buffers that the workers wrote them to (except for the first batch of a task, which gives the layout of the paths)
     """
-    singleton_pool.run_each(
-        _worker_set_policy_params,
-        [(policy_params, scope)] * singleton_pool.n_parallel
-    )
-    if env_params is not None:
-        singleton_pool.run_each(
-            _worker_set_env_params,
-            [(env_params, scope)] * singleton_pool.n_parallel
+    broadcast_params(policy_params, env_params, scope)
+    path_buffers = _make_path_buffers(max_samples, max_path_length, scope)
+    try:
+        results = singleton_pool.run_collect(
+            _worker_collect_one_path,
+            threshold=max_samples,
+            args=(max_path_length, scope, path_buffers),
+            show_prog_bar=True
         )
-    return singleton_pool.run_collect(
-        _worker_collect_one_path,
-        threshold=max_samples,
-        args=(max_path_length, scope),
-        show_prog_bar=True
-    )
+    finally:
+        # every worker has attached to the buffers by now, so the files are not needed anymore
+        if path_buffers is not None:
+            path_buffers.unlink()
+    if path_buffers is None:
+        if singleton_pool.n_parallel > 1 and len(results) > 0:
+            _path_schemas[scope] = path_schema(results[0])
+        return results
+    return [path_buffers.read(result) for result in results]
 
 
 def truncate_paths(paths, max_samples):
@@ -0,0 +1,154 @@
+import os
+import tempfile
+
+import numpy as np
+
+
+def _shared_memory_dir():
+    # /dev/shm is a RAM-backed filesystem on Linux; elsewhere fall back to the default temporary folder
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class SharedArray(object):
+    """
+    Numpy array living in shared memory, backed by a memory-mapped file. Pickling it only sends the name of the file,
+    so it can be handed to the workers of an already running pool, which then read and write the same memory without
+    any copy. Once every process that needs it has attached, the creator can unlink the file: the existing mappings
+    stay valid until they are closed.
+    """
+
+    def __init__(self, shape, dtype=np.float64):
+        self.shape = tuple(np.atleast_1d(shape).astype(int))
+        self.dtype = np.dtype(dtype)
+        fd, self.filename = tempfile.mkstemp(prefix="rllab_shared_", dir=_shared_memory_dir())
+        os.close(fd)
+        self._owner = True
+        self.array = self._map(mode='w+')
+
+    def _map(self, mode):
+        # memmap can not map an empty file, so always allocate at least one element
+        size = int(np.prod(self.shape))
+        data = np.memmap(self.filename, dtype=self.dtype, mode=mode, shape=(max(size, 1),))
+        # plain ndarray view, which keeps the mapping alive and behaves (and pickles) like any other array
+        return data[:size].reshape(self.shape).view(np.ndarray)
+
+    def __getstate__(self):
+        return dict(filename=self.filename, shape=self.shape, dtype=self.dtype.str)
+
+    def __setstate__(self, d):
+        self.filename = d["filename"]
+        self.shape = d["shape"]
+        self.dtype = np.dtype(d["dtype"])
+        self._owner = False
+        self.array = self._map(mode='r+')
+
+    def unlink(self):
+        """
+        Remove the backing file. Only the process that created the array does it; arrays that are already attached
+        keep working, but the array can not be pickled to new processes afterwards.
+        """
+        if self._owner and os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+def shared_memory_free_bytes():
+    stats = os.statvfs(_shared_memory_dir())
+    return stats.f_bavail * stats.f_frsize
+
+
+def split_path(path, path_length):
+    """
+    Split a path into its time-indexed arrays, keyed by their key path in the (possibly nested) path dict, and a
+    skeleton holding everything else, with the same nesting.
+    """
+    arrays = dict()
+    skeleton = dict()
+    for k, v in path.items():
+        if isinstance(v, dict):
+            sub_arrays, skeleton[k] = split_path(v, path_length)
+            for key, array in sub_arrays.items():
+                arrays[(k,) + key] = array
+        elif isinstance(v, np.ndarray) and v.ndim >= 1 and len(v) == path_length:
+            arrays[(k,)] = v
+        else:
+            skeleton[k] = v
+    return arrays, skeleton
+
+
+def path_schema(path):
+    """
+    Shapes (without the time dimension) and dtypes of the time-indexed arrays of a path.
+    """
+    arrays, _ = split_path(path, len(path["rewards"]))
+    return dict((key, (array.shape[1:], array.dtype.str)) for key, array in arrays.items())
+
+
+class SharedPathBuffers(object):
+    """
+    Shared-memory buffers where the sampler workers write the arrays of the paths they collect, each worker in its
+    own region of capacity time steps. Workers only send back the position of each path in their region, and the
+    master builds the paths as views of the buffers. Buffers are allocated for each batch, so the paths stay valid
+    after later batches are collected.
+    """
+
+    def __init__(self, schema, n_workers, capacity):
+        """
+        :param schema: shapes and dtypes of the arrays of the paths, as given by path_schema
+        :param n_workers: number of workers, which write to the region of their worker_id
+        :param capacity: number of time steps each worker can write
+        """
+        self.schema = schema
+        self.capacity = capacity
+        self.arrays = dict(
+            (key, SharedArray((n_workers, capacity) + tuple(shape), dtype)) for key, (shape, dtype) in schema.items()
+        )
+        self._cursor = 0
+
+    def __getstate__(self):
+        return dict(schema=self.schema, capacity=self.capacity, arrays=self.arrays)
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self._cursor = 0
+
+    def write(self, worker_id, path):
+        """
+        Called by the workers. Copy the arrays of the path to the region of the worker, and return the descriptor to
+        send to the master instead of the path. If the path does not match the schema or does not fit, return the
+        path itself.
+        """
+        path_length = len(path["rewards"])
+        if worker_id is None or path_length == 0 or self._cursor + path_length > self.capacity:
+            return path
+        arrays, skeleton = split_path(path, path_length)
+        if set(arrays.keys()) != set(self.schema.keys()):
+            return path
+        for key, array in arrays.items():
+            shape, dtype = self.schema[key]
+            if array.shape[1:] != tuple(shape) or array.dtype.str != dtype:
+                return path
+        start = self._cursor
+        for key, array in arrays.items():
+            self.arrays[key].array[worker_id, start:start + path_length] = array
+        self._cursor += path_length
+        return worker_id, start, path_length, skeleton
+
+    def read(self, descriptor):
+        """
+        Called by the master with what the workers returned: rebuild the path with views of the buffers.
+        """
+        if isinstance(descriptor, dict):
+            return descriptor
+        worker_id, start, path_length, path = descriptor
+        for key, shared_array in self.arrays.items():
+            node = path
+            for k in key[:-1]:
+                node = node[k]
+            node[key[-1]] = shared_array.array[worker_id, start:start + path_length]
+        return path
+
+    def unlink(self):
+        for shared_array in self.arrays.values():
+            shared_array.unlink()
@@ -41,6 +41,8 @@ class StatefulPool(object):
         self.pool = None
         self.queue = None
         self.worker_queue = None
+        self.collect_counter = None
+        self.collect_done = None
         self.G = SharedGlobal()
 
     def initialize(self, n_parallel):
@@ -54,6 +56,10 @@ class StatefulPool(object):
         if n_parallel > 1:
             self.queue = mp.Queue()
             self.worker_queue = mp.Queue()
+            # created before the pool so that the workers inherit them: the counter lives in shared memory and its lock
+            # is a plain semaphore, with no round-trip to a manager process
+            self.collect_counter = mp.Value('i', 0)
+            self.collect_done = mp.Event()
             # FIXME: memmap is slow.
             # self.pool = MemmapingPool(
             #     self.n_parallel,
@@ -122,26 +128,29 @@ class StatefulPool(object):
         if args is None:
             args = tuple()
         if self.pool:
-            manager = mp.Manager()
-            counter = manager.Value('i', 0)
-            lock = manager.RLock()
+            counter = self.collect_counter
+            with counter.get_lock():
+                counter.value = 0
+            self.collect_done.clear()
             results = self.pool.map_async(
                 _worker_run_collect,
-                [(collect_once, counter, lock, threshold, args)] * self.n_parallel
+                [(collect_once, threshold, args)] * self.n_parallel
             )
             if show_prog_bar:
                 pbar = ProgBarCounter(threshold)
             last_value = 0
             while True:
-                time.sleep(0.1)
-                with lock:
-                    if counter.value >= threshold:
-                        if show_prog_bar:
-                            pbar.stop()
-                        break
+                # the workers set the event as soon as the threshold is reached; the timeout only paces the progress
+                # bar and notices workers that died with an exception
+                done = self.collect_done.wait(0.1)
+                if done or results.ready():
                     if show_prog_bar:
-                        pbar.inc(counter.value - last_value)
-                    last_value = counter.value
+                        pbar.stop()
+                    break
+                if show_prog_bar:
+                    value = counter.value
+                    pbar.inc(value - last_value)
+                    last_value = value
             print('Done sampling.')
             start = time.time()
             out = sum(results.get(), [])
@@ -181,18 +190,20 @@ def _worker_run_each(all_args):
 
 def _worker_run_collect(all_args):
     try:
-        collect_once, counter, lock, threshold, args = all_args
+        collect_once, threshold, args = all_args
+        counter = singleton_pool.collect_counter
         collected = []
         while True:
-            with lock:
-                if counter.value >= threshold:
-                    return collected
+            if counter.value >= threshold:
+                return collected
             result, inc = collect_once(singleton_pool.G, *args)
             collected.append(result)
-            with lock:
+            with counter.get_lock():
                 counter.value += inc
-                if counter.value >= threshold:
-                    return collected
+                value = counter.value
+            if value >= threshold:
+                singleton_pool.collect_done.set()
+                return collected
     except Exception:
         raise Exception("".join(traceback.format_exception(*sys.exc_info())))
 
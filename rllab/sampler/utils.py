@@ -50,3 +50,55 @@ def rollout(env, agent, max_path_length=np.inf, animated=False, speedup=1, init_
         dones=np.asarray(dones),
         last_obs=o,
     )
+
+
+def vec_rollout(vec_env, agent, max_path_length=np.inf):
+    """
+    Roll out one path in each copy of a VecEnv, querying the (non-recurrent) agent once per time step for all the
+    copies that are still running. Copies that are done, or that reached max_path_length, are not stepped anymore.
+    :return: a list with one path per environment copy, in the same format as rollout
+    """
+    n_envs = vec_env.n_envs
+    observation_space = vec_env.observation_space
+    action_space = vec_env.action_space
+    observations = [[] for _ in range(n_envs)]
+    actions = [[] for _ in range(n_envs)]
+    rewards = [[] for _ in range(n_envs)]
+    agent_infos = [[] for _ in range(n_envs)]
+    env_infos = [[] for _ in range(n_envs)]
+    dones = [[] for _ in range(n_envs)]
+    last_obs = vec_env.reset()
+    agent.reset()
+    running = list(range(n_envs))
+    path_length = 0
+    while len(running) > 0 and path_length < max_path_length:
+        running_obs = [last_obs[i] for i in running]
+        action_n, agent_info_n = agent.get_actions(running_obs)
+        next_obs, reward_n, done_n, env_info_n = vec_env.step(action_n, env_ids=running)
+        path_length += 1
+        still_running = []
+        for idx, i in enumerate(running):
+            observations[i].append(observation_space.flatten(running_obs[idx]))
+            actions[i].append(action_space.flatten(action_n[idx]))
+            rewards[i].append(reward_n[idx])
+            agent_infos[i].append({k: v[idx] for k, v in agent_info_n.items()})
+            env_infos[i].append(env_info_n[idx])
+            dones[i].append(done_n[idx])
+            if done_n[idx]:
+                continue
+            last_obs[i] = next_obs[idx]
+            still_running.append(i)
+        running = still_running
+
+    return [
+        dict(
+            observations=tensor_utils.stack_tensor_list(observations[i]),
+            actions=tensor_utils.stack_tensor_list(actions[i]),
+            rewards=tensor_utils.stack_tensor_list(rewards[i]),
+            agent_infos=tensor_utils.stack_tensor_dict_list(agent_infos[i]),
+            env_infos=tensor_utils.stack_tensor_dict_list(env_infos[i]),
+            dones=np.asarray(dones[i]),
+            last_obs=last_obs[i],
+        )
+        for i in range(n_envs)
+    ]
@@ -0,0 +1,75 @@
+import numpy as np
+
+from rllab.envs.vec_env import VecEnv
+from rllab.sampler import parallel_sampler
+from rllab.sampler.base import BaseSampler
+from rllab.sampler.stateful_pool import singleton_pool
+from rllab.sampler.utils import vec_rollout
+
+
+def _worker_init_vec_env(G, n_envs, scope=None):
+    G = parallel_sampler._get_scoped_G(G, scope)
+    G.vec_env = VecEnv(G.env, n_envs)
+
+
+def _worker_terminate_vec_env(G, scope=None):
+    G = parallel_sampler._get_scoped_G(G, scope)
+    if getattr(G, "vec_env", None):
+        G.vec_env.terminate()
+        G.vec_env = None
+
+
+def _worker_collect_vec_paths(G, max_path_length, scope=None):
+    G = parallel_sampler._get_scoped_G(G, scope)
+    parallel_sampler.sync_shared_params(G)
+    paths = vec_rollout(G.vec_env, G.policy, max_path_length)
+    return paths, sum(len(path["rewards"]) for path in paths)
+
+
+class VectorizedSampler(BaseSampler):
+    """
+    Sampler that holds n_envs copies of the environment on each worker and steps them in lock-step, calling the
+    policy's get_actions once per time step for all of them. Use it through BatchPolopt(sampler_cls=...).
+    """
+
+    def __init__(self, algo, n_envs=None):
+        """
+        :type algo: BatchPolopt
+        :param n_envs: number of environment copies per worker. By default, enough to roughly fill the batch with
+        paths of max_path_length in a single round.
+        """
+        super(VectorizedSampler, self).__init__(algo)
+        assert not algo.policy.recurrent, "VectorizedSampler requires a non-recurrent policy"
+        if n_envs is None:
+            n_envs = int(np.ceil(algo.batch_size / float(algo.max_path_length * singleton_pool.n_parallel)))
+            n_envs = max(1, min(n_envs, 100))
+        self.n_envs = n_envs
+
+    def start_worker(self):
+        parallel_sampler.populate_task(self.algo.env, self.algo.policy, scope=self.algo.scope)
+        singleton_pool.run_each(
+            _worker_init_vec_env,
+            [(self.n_envs, self.algo.scope)] * singleton_pool.n_parallel
+        )
+
+    def shutdown_worker(self):
+        singleton_pool.run_each(
+            _worker_terminate_vec_env,
+            [(self.algo.scope,)] * singleton_pool.n_parallel
+        )
+        parallel_sampler.terminate_task(scope=self.algo.scope)
+
+    def obtain_samples(self, itr):
+        cur_params = self.algo.policy.get_param_values()
+        parallel_sampler.broadcast_params(cur_params, scope=self.algo.scope)
+        results = singleton_pool.run_collect(
+            _worker_collect_vec_paths,
+            threshold=self.algo.batch_size,
+            args=(self.algo.max_path_length, self.algo.scope),
+            show_prog_bar=True
+        )
+        paths = [path for worker_paths in results for path in worker_paths]
+        if self.algo.whole_paths:
+            return paths
+        else:
+            return parallel_sampler.truncate_paths(paths, self.algo.batch_size)
@@ -1,5 +1,8 @@
 import csv
 from rllab.misc import ext
+import hashlib
+import multiprocessing
+from rllab.misc.tabular_log import tabular_log_file, read_tabular_log
 import os
 import numpy as np
 import base64
@@ -21,21 +24,126 @@ def flatten(l):
     return [item for sublist in l for item in sublist]
 
 
+def _to_floats(values):
+    """
+    Convert a column of strings to floats at once, falling back to one cell at a time (with 0 for the cells that are
+    not numbers) when some cell can not be converted.
+    """
+    values = ['nan' if v is None else v for v in values]
+    try:
+        return np.array(values, dtype=str).astype(np.float64)
+    except ValueError:
+        column = np.empty(len(values))
+        for i, v in enumerate(values):
+            try:
+                column[i] = float(v)
+            except ValueError:
+                column[i] = 0.
+        return column
+
+
+def _parse_progress(file_name, offset=0, keys=None):
+    """
+    Parse the rows of a progress file (the row log, or the csv) from the byte offset on, which must be a line
+    boundary. keys are the keys in effect at the offset, as returned by the previous call.
+    :return: the keys, the parsed columns (NaN for the rows a key does not appear in) and the offset to continue from
+    """
+    if file_name.endswith(".jsonl"):
+        keys, rows, offset = read_tabular_log(file_name, offset=offset, keys=keys)
+        columns = dict((k, _to_floats([row.get(k) for row in rows])) for k in keys)
+        return keys, columns, offset
+    with open(file_name, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    rows = list(csv.reader(data[:end].decode('utf-8').splitlines()))
+    if keys is None:
+        if len(rows) == 0:
+            return None, dict(), offset
+        keys, rows = rows[0], rows[1:]
+    columns = dict((k, _to_floats([row[i] if i < len(row) else '' for row in rows])) for i, k in enumerate(keys))
+    return keys, columns, offset + end
+
+
+def _progress_file(progress_csv_path):
+    # the row log written next to the csv is append-only, so it can be parsed incrementally
+    log_path = tabular_log_file(progress_csv_path)
+    if os.path.exists(log_path):
+        return log_path
+    return progress_csv_path
+
+
 def load_progress(progress_csv_path):
     print("Reading %s" % progress_csv_path)
-    entries = dict()
-    with open(progress_csv_path, 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            for k, v in row.items():
-                if k not in entries:
-                    entries[k] = []
-                try:
-                    entries[k].append(float(v))
-                except:
-                    entries[k].append(0.)
-    entries = dict([(k, np.array(v)) for k, v in entries.items()])
-    return entries
+    _, columns, _ = _parse_progress(_progress_file(progress_csv_path))
+    return columns
+
+
+def default_cache_dir():
+    return os.path.expanduser("~/.cache/rllab/viskit")
+
+
+_FINGERPRINT_TAIL_SIZE = 4096
+
+
+def _prefix_fingerprint(file_name, size):
+    """
+    Fingerprint of the first size bytes of a file: its first line (the header or the first keys) and the last few
+    KB before size. It reads a bounded amount of the file, and tells a file that was only appended to from one that
+    was written again.
+    """
+    with open(file_name, 'rb') as f:
+        header = f.readline(min(size, 1 << 16))
+        f.seek(max(size - _FINGERPRINT_TAIL_SIZE, 0))
+        tail = f.read(size - f.tell())
+    return hashlib.md5(header + b'\n' + tail).hexdigest()
+
+
+def load_progress_cached(progress_csv_path, cache_dir):
+    """
+    Same as load_progress, with the parsed columns kept in cache_dir. The cache entry of a file is keyed by its
+    path, modification time and size: an unchanged file is not read at all. When the file changed, only the appended
+    rows are parsed if the part that was parsed before is unchanged (checked with a fingerprint of its first line and
+    its end), and the whole file is parsed again otherwise, e.g. after the csv was exported again or the run was
+    restarted.
+    """
+    file_name = os.path.abspath(_progress_file(progress_csv_path))
+    stat = os.stat(file_name)
+    cache_file = os.path.join(cache_dir, hashlib.md5(file_name.encode('utf-8')).hexdigest() + ".pkl")
+    entry = None
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                entry = pickle.load(f)
+        except Exception:
+            entry = None
+    if entry is not None and entry["file_name"] == file_name and entry["size"] == stat.st_size and \
+            entry["mtime"] == stat.st_mtime:
+        return entry["columns"]
+    if entry is None or entry["file_name"] != file_name or entry["offset"] > stat.st_size or \
+            entry["keys"] is None or entry.get("fingerprint") != _prefix_fingerprint(file_name, entry["offset"]):
+        entry = dict(file_name=file_name, keys=None, offset=0, columns=dict())
+    print("Reading %s from byte %d" % (file_name, entry["offset"]))
+    keys, new_columns, offset = _parse_progress(file_name, offset=entry["offset"], keys=entry["keys"])
+    if entry["offset"] > 0:
+        n_rows = len(next(iter(entry["columns"].values()))) if entry["columns"] else 0
+        n_new_rows = len(next(iter(new_columns.values()))) if new_columns else 0
+        columns = dict()
+        for k in keys:
+            old = entry["columns"].get(k, np.full(n_rows, np.nan))
+            new = new_columns.get(k, np.full(n_new_rows, np.nan))
+            columns[k] = np.concatenate([old, new])
+    else:
+        columns = new_columns
+    entry = dict(file_name=file_name, size=stat.st_size, mtime=stat.st_mtime, keys=keys, offset=offset,
+                 fingerprint=_prefix_fingerprint(file_name, offset), columns=columns)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+    return columns
 
 
 def to_json(stub_object):
@@ -93,30 +201,62 @@ def lookup(d, keys):
     return d
 
 
-def load_exps_data(exp_folder_paths, disable_variant=False, ignore_missing_keys=False):
+def _load_exp_data(exp_path, disable_variant, cache_dir):
+    params_json_path = os.path.join(exp_path, "params.json")
+    variant_json_path = os.path.join(exp_path, "variant.json")
+    progress_csv_path = os.path.join(exp_path, "progress.csv")
+    try:
+        if cache_dir is not None:
+            progress = load_progress_cached(progress_csv_path, cache_dir)
+        else:
+            progress = load_progress(progress_csv_path)
+        if disable_variant:
+            params = load_params(params_json_path)
+        else:
+            try:
+                params = load_params(variant_json_path)
+            except IOError:
+                params = load_params(params_json_path)
+    except (IOError, ValueError, csv.Error) as e:
+        # a missing or malformed file only skips its experiment
+        print("Failed to load %s: %s" % (exp_path, e))
+        return None
+    return progress, params
+
+
+def load_exps_data(exp_folder_paths, disable_variant=False, ignore_missing_keys=False, n_workers=None,
+                   cache_dir=None, use_cache=True):
+    """
+    :param n_workers: number of processes parsing the experiments, by default the number of cpus
+    :param cache_dir: where to cache the parsed progress files, by default default_cache_dir()
+    :param use_cache: whether to use the cache, so that reloading only parses the experiments that changed
+    """
     exps = []
     for exp_folder_path in exp_folder_paths:
         exps += [x[0] for x in os.walk(exp_folder_path, followlinks=True)]
     print("finished walking exp folders")
-    exps_data = []
-    for exp in exps:
+    if use_cache and cache_dir is None:
+        cache_dir = default_cache_dir()
+    elif not use_cache:
+        cache_dir = None
+    load_args = [(exp, disable_variant, cache_dir) for exp in exps]
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    if n_workers > 1 and len(exps) > 1:
+        pool = multiprocessing.Pool(min(n_workers, len(exps)))
         try:
-            exp_path = exp
-            params_json_path = os.path.join(exp_path, "params.json")
-            variant_json_path = os.path.join(exp_path, "variant.json")
-            progress_csv_path = os.path.join(exp_path, "progress.csv")
-            progress = load_progress(progress_csv_path)
-            if disable_variant:
-                params = load_params(params_json_path)
-            else:
-                try:
-                    params = load_params(variant_json_path)
-                except IOError:
-                    params = load_params(params_json_path)
+            results = pool.starmap(_load_exp_data, load_args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_load_exp_data(*args) for args in load_args]
+    exps_data = []
+    for result in results:
+        if result is not None:
+            progress, params = result
             exps_data.append(ext.AttrDict(
                 progress=progress, params=params, flat_params=flatten_dict(params)))
-        except IOError as e:
-            print(e)
 
     # a dictionary of all keys and types of values
     all_keys = dict()
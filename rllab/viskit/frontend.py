@@ -725,7 +725,8 @@ def reload_data():
     global exps_data
     global plottable_keys
     global distinct_params
-    exps_data = core.load_exps_data(args.data_paths, args.disable_variant)
+    exps_data = core.load_exps_data(args.data_paths, args.disable_variant, n_workers=args.n_workers,
+                                    use_cache=not args.no_cache)
     plottable_keys = sorted(list(
         set(flatten(list(exp.progress.keys()) for exp in exps_data))))
     distinct_params = sorted(core.extract_distinct_params(exps_data))
@@ -738,6 +739,10 @@ if __name__ == "__main__":
     parser.add_argument("--debug", action="store_true", default=False)
     parser.add_argument("--port", type=int, default=5000)
     parser.add_argument("--disable-variant", default=False, action='store_true')
+    parser.add_argument("--n-workers", type=int, default=None,
+        help='Number of processes parsing the experiments (default: number of cpus)')
+    parser.add_argument("--no-cache", default=False, action='store_true',
+        help='Parse all the progress files again instead of using the cache of parsed files')
     parser.add_argument("-o", default=False, action='store_true',
         help='Open a brower tab automatically')
     args = parser.parse_args(sys.argv[1:])
@@ -0,0 +1,62 @@
+"""
+Microbenchmark of the per-step overhead of reading env.observation_space / env.action_space, as rollout does on every
+step through env.observation_space.flatten(o). It compares the cached spaces with rebuilding them at every access.
+
+python scripts/benchmark_env_spaces.py --maze_id 0 --n_steps 10000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from rllab import spaces
+from rllab.envs.mujoco.mujoco_env import BIG
+from rllab.envs.normalized_env import normalize
+from rllab.policies.uniform_control_policy import UniformControlPolicy
+from rllab.sampler.utils import rollout
+
+from curriculum.envs.base import FixedStateGenerator
+from curriculum.envs.goal_env import GoalExplorationEnv
+from curriculum.envs.maze.point_maze_env import PointMazeEnv
+from scripts.benchmark_utils import time_per_call
+
+
+def rebuilt_observation_space(env):
+    """ What every access to observation_space cost before the spaces were cached. """
+    shp = env.get_current_obs().shape
+    ub = BIG * np.ones(shp)
+    return spaces.Box(ub * -1, ub)
+
+
+def run_benchmark(maze_id, n_steps, horizon):
+    env = GoalExplorationEnv(
+        env=normalize(PointMazeEnv(maze_id=maze_id)),
+        goal_generator=FixedStateGenerator(state=(0, 4)),
+        obs2goal_transform=lambda x: x[:2],
+    )
+    env.reset()
+    obs = env.get_current_obs()
+
+    cached = time_per_call(lambda: env.observation_space.flatten(obs), n_steps)
+    rebuilt = time_per_call(lambda: rebuilt_observation_space(env).flatten(obs), n_steps)
+    print("observation_space.flatten per step: cached {:.2f} us, rebuilt {:.2f} us".format(
+        cached * 1e6, rebuilt * 1e6))
+
+    cached = time_per_call(lambda: env.action_space, n_steps)
+    print("action_space access per step: cached {:.2f} us".format(cached * 1e6))
+
+    policy = UniformControlPolicy(env_spec=env.spec)
+    n_samples = 0
+    start = time.time()
+    while n_samples < n_steps:
+        n_samples += len(rollout(env, policy, max_path_length=horizon)["rewards"])
+    print("rollout: {:.0f} steps/sec".format(n_samples / (time.time() - start)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--maze_id', type=int, default=0, help='id of the PointMazeEnv maze')
+    parser.add_argument('--n_steps', type=int, default=10000, help='number of timed steps')
+    parser.add_argument('--horizon', type=int, default=500, help='max path length of the timed rollouts')
+    args = parser.parse_args()
+    run_benchmark(args.maze_id, args.n_steps, args.horizon)
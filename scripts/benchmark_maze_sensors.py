@@ -0,0 +1,91 @@
+"""
+Benchmark of the maze ray sensors: steps/sec of AntMaze, SwimmerMaze and PointMaze with the vectorized sensors,
+and time of a sensor reading compared to the original per-ray / per-segment python loop, which is also used to check
+that the readings are identical.
+
+python scripts/benchmark_maze_sensors.py --n_steps 2000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from rllab.envs.mujoco.maze.ant_maze_env import AntMazeEnv
+from rllab.envs.mujoco.maze.maze_env_utils import ray_segment_intersect, point_distance
+from rllab.envs.mujoco.maze.point_maze_env import PointMazeEnv
+from rllab.envs.mujoco.maze.swimmer_maze_env import SwimmerMazeEnv
+
+
+def reference_maze_obs(env):
+    """ Original implementation of MazeEnv.get_current_maze_obs, rebuilding the segments and looping in python. """
+    robot_x, robot_y = env.wrapped_env.get_body_com("torso")[:2]
+    ori = env.get_ori()
+    structure = env.MAZE_STRUCTURE
+    size_scaling = env.MAZE_SIZE_SCALING
+    segments = []
+    for i in range(len(structure)):
+        for j in range(len(structure[0])):
+            if structure[i][j] == 1 or structure[i][j] == 'g':
+                cx = j * size_scaling - env._init_torso_x
+                cy = i * size_scaling - env._init_torso_y
+                x1 = cx - 0.5 * size_scaling
+                x2 = cx + 0.5 * size_scaling
+                y1 = cy - 0.5 * size_scaling
+                y2 = cy + 0.5 * size_scaling
+                struct_segments = [
+                    ((x1, y1), (x2, y1)),
+                    ((x2, y1), (x2, y2)),
+                    ((x2, y2), (x1, y2)),
+                    ((x1, y2), (x1, y1)),
+                ]
+                for seg in struct_segments:
+                    segments.append(dict(segment=seg, type=structure[i][j]))
+    wall_readings = np.zeros(env._n_bins)
+    goal_readings = np.zeros(env._n_bins)
+    for ray_idx in range(env._n_bins):
+        ray_ori = ori - env._sensor_span * 0.5 + 1.0 * (2 * ray_idx + 1) / (2 * env._n_bins) * env._sensor_span
+        ray_segments = []
+        for seg in segments:
+            p = ray_segment_intersect(ray=((robot_x, robot_y), ray_ori), segment=seg["segment"])
+            if p is not None:
+                ray_segments.append(dict(type=seg["type"], distance=point_distance(p, (robot_x, robot_y))))
+        if len(ray_segments) > 0:
+            first_seg = sorted(ray_segments, key=lambda x: x["distance"])[0]
+            if first_seg["distance"] <= env._sensor_range:
+                reading = (env._sensor_range - first_seg["distance"]) / env._sensor_range
+                if first_seg["type"] == 1:
+                    wall_readings[ray_idx] = reading
+                else:
+                    goal_readings[ray_idx] = reading
+    return np.concatenate([wall_readings, goal_readings])
+
+
+def run_benchmark(env_cls, n_steps):
+    env = env_cls()
+    env.reset()
+    sensor_time = reference_time = 0.
+    start = time.time()
+    for _ in range(n_steps):
+        _, _, done, _ = env.step(env.action_space.sample())
+        t0 = time.time()
+        readings = env.get_current_maze_obs()
+        t1 = time.time()
+        reference = reference_maze_obs(env)
+        t2 = time.time()
+        sensor_time += t1 - t0
+        reference_time += t2 - t1
+        assert np.array_equal(readings, reference), "the vectorized readings differ from the reference ones"
+        if done:
+            env.reset()
+    # the timed loop also computed the sensors twice more per step: remove them to report the env steps/sec
+    env_time = time.time() - start - sensor_time - reference_time
+    print("{}: {:.0f} steps/sec, sensors {:.1f} us/step (python loop {:.1f} us/step)".format(
+        env_cls.__name__, n_steps / env_time, sensor_time / n_steps * 1e6, reference_time / n_steps * 1e6))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_steps', type=int, default=2000, help='number of timed steps per env')
+    args = parser.parse_args()
+    for env_cls in [AntMazeEnv, SwimmerMazeEnv, PointMazeEnv]:
+        run_benchmark(env_cls, args.n_steps)
@@ -0,0 +1,100 @@
+"""
+Benchmark of BaseSampler.process_samples, on batches of many short paths as in goal-reaching envs that terminate
+early, with a stub algo whose baseline predictions are fixed. It times the whole call, which computes the advantages
+and returns with a segmented reverse scan over the concatenated batch, against the previous loop calling
+discount_cumsum on each path alone, and checks that both give the same values.
+
+python scripts/benchmark_process_samples.py --batch_size 50000 --max_path_length 100
+"""
+import argparse
+
+import numpy as np
+
+from rllab.misc import logger
+from rllab.misc import special
+from rllab.misc import tensor_utils
+from rllab.sampler.base import BaseSampler
+from scripts.benchmark_utils import time_per_call
+
+
+def per_path_advantages(paths, all_path_baselines, discount, gae_lambda):
+    """ What process_samples did before: two discount_cumsum per path, then concatenating everything again. """
+    for idx, path in enumerate(paths):
+        path_baselines = np.append(all_path_baselines[idx], 0)
+        deltas = path["rewards"] + discount * path_baselines[1:] - path_baselines[:-1]
+        path["advantages"] = special.discount_cumsum(deltas, discount * gae_lambda)
+        path["returns"] = special.discount_cumsum(path["rewards"], discount)
+    advantages = tensor_utils.concat_tensor_list([path["advantages"] for path in paths])
+    returns = tensor_utils.concat_tensor_list([path["returns"] for path in paths])
+    return advantages, returns
+
+
+class _FixedBaseline(object):
+    """ Baseline predicting the values stored in the paths, without fitting anything. """
+
+    def predict(self, path):
+        return path["baselines"]
+
+    def fit(self, paths):
+        pass
+
+
+class _Distribution(object):
+    def entropy(self, dist_info):
+        return np.zeros(1)
+
+
+class _Policy(object):
+    recurrent = False
+    distribution = _Distribution()
+
+
+class _Algo(object):
+    def __init__(self, discount, gae_lambda):
+        self.baseline = _FixedBaseline()
+        self.policy = _Policy()
+        self.discount = discount
+        self.gae_lambda = gae_lambda
+        self.center_adv = False
+        self.positive_adv = False
+
+
+def run_benchmark(batch_size, max_path_length, discount, gae_lambda, n_calls):
+    paths = []
+    n_samples = 0
+    while n_samples < batch_size:
+        path_length = np.random.randint(1, max_path_length + 1)
+        paths.append(dict(
+            observations=np.zeros((path_length, 1)),
+            actions=np.zeros((path_length, 1)),
+            rewards=np.random.randn(path_length),
+            baselines=np.random.randn(path_length).astype(np.float32),
+            env_infos=dict(),
+            agent_infos=dict(),
+        ))
+        n_samples += path_length
+    all_path_baselines = [path["baselines"] for path in paths]
+    print("{} paths, {} samples".format(len(paths), n_samples))
+    sampler = BaseSampler(_Algo(discount, gae_lambda))
+    logger.disable()
+
+    reference = per_path_advantages(paths, all_path_baselines, discount, gae_lambda)
+    samples_data = sampler.process_samples(0, paths)
+    assert np.array_equal(reference[0], samples_data["advantages"]) and \
+        np.array_equal(reference[1], samples_data["returns"]), "process_samples differs from the reference"
+
+    per_call = time_per_call(lambda: per_path_advantages(paths, all_path_baselines, discount, gae_lambda), n_calls)
+    print("per-path discount_cumsum: {:.2f} ms".format(per_call * 1e3))
+    per_call = time_per_call(lambda: sampler.process_samples(0, paths), n_calls)
+    print("whole process_samples, with the segmented reverse scan: {:.2f} ms".format(per_call * 1e3))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=50000, help='number of samples in the batch')
+    parser.add_argument('--max_path_length', type=int, default=100, help='paths have random lengths up to this')
+    parser.add_argument('--discount', type=float, default=0.99)
+    parser.add_argument('--gae_lambda', type=float, default=0.97)
+    parser.add_argument('--n_calls', type=int, default=10, help='number of timed calls')
+    args = parser.parse_args()
+    run_benchmark(args.batch_size, args.max_path_length, args.discount, args.gae_lambda, args.n_calls)
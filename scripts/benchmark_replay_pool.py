@@ -0,0 +1,76 @@
+"""
+Microbenchmark of random_batch of the DDPG SimpleReplayPool and of ReplayPool, in batches per second on full pools of
+1M transitions. For SimpleReplayPool it also times the previous sampling loop, which drew the indices one at a time.
+
+python scripts/benchmark_replay_pool.py --pool_size 1000000 --observation_dim 20 --action_dim 6 --batch_size 32
+"""
+import argparse
+
+import numpy as np
+
+from rllab.algos.ddpg import SimpleReplayPool
+from rllab.algos.util import ReplayPool
+from scripts.benchmark_utils import time_per_call
+
+
+def loop_random_batch(pool, batch_size):
+    """ What SimpleReplayPool.random_batch did before. """
+    indices = np.zeros(batch_size, dtype='uint64')
+    transition_indices = np.zeros(batch_size, dtype='uint64')
+    count = 0
+    while count < batch_size:
+        index = np.random.randint(pool._bottom, pool._bottom + pool._size) % pool._max_pool_size
+        if index == pool._size - 1 and pool._size <= pool._max_pool_size:
+            continue
+        indices[count] = index
+        transition_indices[count] = (index + 1) % pool._max_pool_size
+        count += 1
+    return dict(
+        observations=pool._observations[indices],
+        actions=pool._actions[indices],
+        rewards=pool._rewards[indices],
+        terminals=pool._terminals[indices],
+        next_observations=pool._observations[transition_indices]
+    )
+
+
+def batches_per_sec(fn, n_batches):
+    return 1. / time_per_call(fn, n_batches)
+
+
+def run_benchmark(pool_size, observation_dim, action_dim, batch_size, n_batches):
+    pool = SimpleReplayPool(pool_size, observation_dim, action_dim)
+    replay_pool = ReplayPool((observation_dim,), action_dim, pool_size)
+    # filling the pools one sample at a time would dominate the benchmark
+    for p in [pool, replay_pool]:
+        for _ in range(2):
+            p.add_sample(np.random.randn(observation_dim), np.random.randn(action_dim), np.random.randn(), False)
+    pool._observations[:] = np.random.randn(pool_size, observation_dim)
+    pool._top, pool._size = 0, pool_size
+    replay_pool.observations[:] = pool._observations
+    replay_pool.terminals[:] = np.random.rand(pool_size) < 0.01
+    replay_pool.top, replay_pool.size = 0, pool_size
+
+    print("SimpleReplayPool.random_batch: {:.0f} batches/sec".format(
+        batches_per_sec(lambda: pool.random_batch(batch_size), n_batches)))
+    batch = pool.random_batch(batch_size)
+    print("SimpleReplayPool.random_batch reusing its output: {:.0f} batches/sec".format(
+        batches_per_sec(lambda: pool.random_batch(batch_size, out=batch), n_batches)))
+    print("previous SimpleReplayPool loop: {:.0f} batches/sec".format(
+        batches_per_sec(lambda: loop_random_batch(pool, batch_size), n_batches)))
+    print("ReplayPool.random_batch: {:.0f} batches/sec".format(
+        batches_per_sec(lambda: replay_pool.random_batch(batch_size), n_batches)))
+    replay_batch = replay_pool.random_batch(batch_size)
+    print("ReplayPool.random_batch reusing its output: {:.0f} batches/sec".format(
+        batches_per_sec(lambda: replay_pool.random_batch(batch_size, out=replay_batch), n_batches)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pool_size', type=int, default=1000000, help='capacity of the pools')
+    parser.add_argument('--observation_dim', type=int, default=20)
+    parser.add_argument('--action_dim', type=int, default=6)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--n_batches', type=int, default=10000, help='number of timed batches')
+    args = parser.parse_args()
+    run_benchmark(args.pool_size, args.observation_dim, args.action_dim, args.batch_size, args.n_batches)
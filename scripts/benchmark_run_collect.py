@@ -0,0 +1,82 @@
+"""
+Per-call benchmark of StatefulPool.run_collect with cheap collect functions, as in the small batches of the curriculum
+inner loops. It compares the shared counter and completion event against the previous implementation, which
+coordinated the workers through a Manager Value and RLock and polled them every 0.1 sec.
+
+python scripts/benchmark_run_collect.py --n_parallel 4 --batch_size 200 --path_length 20 --step_time 1e-4
+"""
+import argparse
+import multiprocessing as mp
+import time
+import traceback
+import sys
+
+from rllab.sampler.stateful_pool import singleton_pool
+from scripts.benchmark_utils import time_per_call
+
+
+def _collect_one_path(G, path_length, step_time):
+    # stand-in for a rollout of path_length steps that take step_time sec each
+    time.sleep(path_length * step_time)
+    return 'path', path_length
+
+
+def _worker_run_collect_manager(all_args):
+    try:
+        collect_once, counter, lock, threshold, args = all_args
+        collected = []
+        while True:
+            with lock:
+                if counter.value >= threshold:
+                    return collected
+            result, inc = collect_once(singleton_pool.G, *args)
+            collected.append(result)
+            with lock:
+                counter.value += inc
+                if counter.value >= threshold:
+                    return collected
+    except Exception:
+        raise Exception("".join(traceback.format_exception(*sys.exc_info())))
+
+
+def run_collect_manager(collect_once, threshold, args):
+    """ What run_collect did before: a new Manager on every call and a polling loop on the master. """
+    manager = mp.Manager()
+    counter = manager.Value('i', 0)
+    lock = manager.RLock()
+    results = singleton_pool.pool.map_async(
+        _worker_run_collect_manager,
+        [(collect_once, counter, lock, threshold, args)] * singleton_pool.n_parallel
+    )
+    while True:
+        time.sleep(0.1)
+        with lock:
+            if counter.value >= threshold:
+                break
+    return sum(results.get(), [])
+
+
+def run_benchmark(n_parallel, batch_size, path_length, step_time, n_calls):
+    singleton_pool.initialize(n_parallel)
+    args = (path_length, step_time)
+    ideal = batch_size * step_time / n_parallel
+    print("ideal time per call: {:.2f} ms".format(ideal * 1e3))
+
+    per_call = time_per_call(
+        lambda: singleton_pool.run_collect(_collect_one_path, threshold=batch_size, args=args, show_prog_bar=False),
+        n_calls)
+    print("run_collect with shared counter: {:.2f} ms per call".format(per_call * 1e3))
+
+    per_call = time_per_call(lambda: run_collect_manager(_collect_one_path, batch_size, args), n_calls)
+    print("run_collect with Manager and polling: {:.2f} ms per call".format(per_call * 1e3))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_parallel', type=int, default=4, help='number of workers')
+    parser.add_argument('--batch_size', type=int, default=200, help='number of samples collected per call')
+    parser.add_argument('--path_length', type=int, default=20, help='length of the collected paths')
+    parser.add_argument('--step_time', type=float, default=1e-4, help='simulated time of an env step, in sec')
+    parser.add_argument('--n_calls', type=int, default=20, help='number of timed calls')
+    args = parser.parse_args()
+    run_benchmark(args.n_parallel, args.batch_size, args.path_length, args.step_time, args.n_calls)
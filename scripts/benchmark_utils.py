@@ -0,0 +1,12 @@
+"""
+Timing helper shared by the scripts/benchmark_*.py microbenchmarks.
+"""
+import time
+
+
+def time_per_call(fn, n_calls):
+    """ Average wall-clock time of n_calls calls of fn, in sec. """
+    start = time.time()
+    for _ in range(n_calls):
+        fn()
+    return (time.time() - start) / n_calls
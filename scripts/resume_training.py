@@ -13,6 +13,7 @@ import json
 import subprocess
 from rllab.misc import logger
 from rllab.misc.instrument import to_local_command
+from rllab.misc.snapshot_writer import load_snapshot
 
 filename = str(uuid.uuid4())
 
@@ -52,7 +53,7 @@ if __name__ == "__main__":
                 raise
     except IOError as e:
         logger.log("Failed to find json file. Continuing in non-stub mode...")
-        data = joblib.load(args.file)
+        data = load_snapshot(args.file)
         assert 'algo' in data
         algo = data['algo']
         assert isinstance(algo, BatchPolopt)
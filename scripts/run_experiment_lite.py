@@ -5,6 +5,7 @@ from rllab.misc.ext import is_iterable, set_seed
 from rllab.misc.instrument import concretize
 from rllab import config
 import rllab.misc.logger as logger
+from rllab.misc.snapshot_writer import load_snapshot
 import argparse
 import os.path as osp
 import datetime
@@ -41,6 +42,11 @@ def run_experiment(argv):
                              '(do not save snapshots)')
     parser.add_argument('--snapshot_gap', type=int, default=1,
                         help='Gap between snapshot iterations.')
+    parser.add_argument('--snapshot_incremental', type=ast.literal_eval, default=False,
+                        help='Whether to save only the parameters and env states at each iteration, on top of a '
+                             'base snapshot saved once')
+    parser.add_argument('--snapshot_async', type=ast.literal_eval, default=False,
+                        help='Whether to write the snapshots on a background thread')
     parser.add_argument('--tabular_log_file', type=str, default='progress.csv',
                         help='Name of the tabular log file (in csv).')
     parser.add_argument('--text_log_file', type=str, default='debug.log',
@@ -104,11 +110,13 @@ def run_experiment(argv):
     logger.set_tf_summary_dir(osp.join(log_dir, "tf_summary"))
     logger.set_snapshot_mode(args.snapshot_mode)
     logger.set_snapshot_gap(args.snapshot_gap)
+    logger.set_snapshot_incremental(args.snapshot_incremental)
+    logger.set_snapshot_async(args.snapshot_async)
     logger.set_log_tabular_only(args.log_tabular_only)
     logger.push_prefix("[%s] " % args.exp_name)
 
     if args.resume_from is not None:
-        data = joblib.load(args.resume_from)
+        data = load_snapshot(args.resume_from)
         assert 'algo' in data
         algo = data['algo']
         maybe_iter = algo.train()
@@ -128,6 +136,7 @@ def run_experiment(argv):
                 for _ in maybe_iter:
                     pass
 
+    logger.set_snapshot_async(False)
     logger.set_snapshot_mode(prev_mode)
     logger.set_snapshot_dir(prev_snapshot_dir)
     logger.remove_tabular_output(tabular_log_file)
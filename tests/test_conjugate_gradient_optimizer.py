@@ -0,0 +1,77 @@
+import gc
+import weakref
+
+import numpy as np
+import pytest
+
+theano = pytest.importorskip("theano")
+import theano.tensor as TT
+
+from rllab.core.parameterized import Parameterized
+from rllab.optimizers.conjugate_gradient_optimizer import ConjugateGradientOptimizer, FiniteDifferenceHvp, \
+    PerlmutterHvp
+
+
+class _Point(Parameterized):
+    def __init__(self):
+        Parameterized.__init__(self)
+        self.x = theano.shared(np.zeros(2, dtype=theano.config.floatX), name="x")
+
+    def get_params_internal(self, **tags):
+        return [self.x]
+
+
+def _optimize(step_size=0.1, target=None, cache_key=None, with_loglik=True, **kwargs):
+    """
+    One update of a point toward the mean of the data, under a trust region on the distance it moves.
+    """
+    if target is None:
+        target = _Point()
+    data = TT.matrix("data")
+    old_x = TT.vector("old_x")
+    loss = TT.mean(TT.sum(TT.square(target.x - data), axis=1))
+    constraint = 0.5 * TT.sum(TT.square(target.x - old_x))
+    optimizer = ConjugateGradientOptimizer(**kwargs)
+    optimizer.update_opt(
+        loss=loss, target=target, leq_constraint=(constraint, step_size), inputs=[data], extra_inputs=[old_x],
+        cache_key=cache_key, precondition_loglik=-loss if with_loglik else None,
+    )
+    data_val = np.random.RandomState(0).randn(50, 2).astype(theano.config.floatX) + 1
+    old_x_val = target.get_param_values(trainable=True)
+    return optimizer.optimize([data_val], extra_inputs=(old_x_val,)), step_size
+
+
+@pytest.mark.parametrize("kwargs", [
+    dict(),
+    dict(speculative_line_search=True),
+    dict(subsample_factor=0.5),
+    dict(precondition=True),
+])
+def test_cg_optimizer_improves_within_trust_region(kwargs):
+    stats, step_size = _optimize(**kwargs)
+    assert stats["loss_after"] < stats["loss_before"]
+    assert stats["constraint_val_after"] <= step_size
+
+
+def test_cg_optimizer_without_backtracks_rejects_step():
+    stats, _ = _optimize(max_backtracks=0, speculative_line_search=True)
+    assert stats["loss_after"] == stats["loss_before"]
+    assert stats["n_line_search_evals"] == 0
+
+
+def test_cg_optimizer_cache_hit_keeps_loglik_grad():
+    target = _Point()
+    _optimize(target=target, cache_key="point", with_loglik=False)
+    stats, step_size = _optimize(target=target, cache_key="point", precondition=True)
+    assert stats["constraint_val_after"] <= step_size
+
+
+@pytest.mark.parametrize("hvp_approach", [PerlmutterHvp, FiniteDifferenceHvp])
+def test_cg_optimizer_cache_entries_dropped_with_target(hvp_approach):
+    target = _Point()
+    stats, step_size = _optimize(target=target, cache_key="point", hvp_approach=hvp_approach())
+    assert stats["constraint_val_after"] <= step_size
+    target_ref = weakref.ref(target)
+    del target
+    gc.collect()
+    assert target_ref() is None